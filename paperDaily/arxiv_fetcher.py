@@ -1,118 +1,409 @@
-import arxiv
-import requests
-import fitz  # PyMuPDF
+import asyncio
+import hashlib
 from datetime import datetime, timedelta
-from config import ARXIV_QUERY, MAX_RESULTS, ARXIV_IDS, ARXIV_CATEGORIES, DAYS_TO_FETCH_PAPERS
-from gemini_analyzer import score_paper_relevance
-from tqdm import tqdm
+from config import (
+    PROFILES, MAX_RESULTS, ARXIV_IDS, DAYS_TO_FETCH_PAPERS, SCORING_BATCH_SIZE,
+    ARXIV_PAGE_SIZE, ARXIV_REQUEST_INTERVAL, ARXIV_MAX_CONCURRENT_REQUESTS, ARXIV_DATE_WINDOW_DAYS,
+    SCORE_CACHE_TTL_DAYS, PREFILTER_ENABLED, PREFILTER_TOP_K, PREFILTER_MIN_SIMILARITY, DEDUP_ENABLED
+)
+from gemini_analyzer import score_papers_for_profiles, get_scoring_cache_key
+from paper_store import get_cached_scores, save_scores, evict_expired_scores, normalize_arxiv_id
+from pdf_cache import cache_key_for_url, get_cached_text, put_cached_text
+from pdf_extractor import download_pdf, extract_pdf_text, release_pdf
+import metrics
+import time
+
+# arxiv, tqdm and the numpy-based prefilter/dedup modules are imported on first use, so
+# importing this module (e.g. for _download_and_extract_text) stays cheap.
 
 def _download_and_extract_text(pdf_url):
     """
-    Downloads a PDF and extracts text from it.
+    Downloads a PDF and extracts text from it. Previously extracted text is
+    served from the PDF cache without touching the network or PyMuPDF.
     """
-    try:
-        response = requests.get(pdf_url, timeout=10)
-        response.raise_for_status()  # Raise an exception for bad status codes
-        
-        # Open the PDF from the in-memory content
-        with fitz.open(stream=response.content, filetype="pdf") as doc:
-            text = ""
-            for page in doc:
-                text += page.get_text()
+    cache_key = cache_key_for_url(pdf_url)
+    text = get_cached_text(cache_key)
+    if text is not None:
         return text
-    except requests.exceptions.RequestException as e:
-        print(f"Error downloading {pdf_url}: {e}")
-        return None
-    except Exception as e:
-        print(f"Error processing PDF from {pdf_url}: {e}")
+    pdf_path = download_pdf(pdf_url)
+    if pdf_path is None:
         return None
+    try:
+        text, stats = extract_pdf_text(pdf_path, source=pdf_url)
+    finally:
+        release_pdf(pdf_path)
+    if text and not stats['truncated']:
+        put_cached_text(cache_key, text)
+    return text
 
-def fetch_latest_papers(analyzed_papers_info: dict = None):
+class _AsyncRateLimiter:
+    """Spaces out request start times by at least `interval` seconds across all tasks."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = asyncio.Lock()
+        self._next_request_at = 0.0
+
+    async def wait(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            delay = self._next_request_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_request_at = loop.time() + self.interval
+
+def _date_windows(start_date, end_date, window_days):
+    """Splits [start_date, end_date] into consecutive windows, newest first."""
+    windows = []
+    window_end = end_date
+    while window_end >= start_date:
+        window_start = max(start_date, window_end - timedelta(days=window_days) + timedelta(seconds=1))
+        windows.append((window_start, window_end))
+        window_end = window_start - timedelta(seconds=1)
+    return windows
+
+def _topic_queries(profiles):
+    """
+    Returns the topic part of the arXiv sub-queries covering every profile: one per
+    category in the union of their categories, plus the keyword query of each
+    profile that has no categories.
+    """
+    topic_queries = []
+    for profile in profiles:
+        if profile.get('categories'):
+            topic_queries += [f"cat:{cat}" for cat in profile['categories']]
+        elif profile.get('query'):
+            topic_queries.append(profile['query'])
+    return list(dict.fromkeys(topic_queries))
+
+def _build_sub_queries(start_date=None, end_date=None, profiles=PROFILES):
+    """
+    Splits the search of all `profiles` into independent arXiv queries: one per
+    category or category-less profile query, and per date window.
+    """
+    if start_date is not None:
+        date_queries = [
+            f"submittedDate:[{window_start.strftime('%Y%m%d%H%M%S')} TO {window_end.strftime('%Y%m%d%H%M%S')}]"
+            for window_start, window_end in _date_windows(start_date, end_date, max(1, ARXIV_DATE_WINDOW_DAYS))
+        ]
+    else:
+        date_queries = [None]
+
+    topic_queries = _topic_queries(profiles) or [None]
+
+    sub_queries = []
+    for date_query in date_queries:
+        for topic_query in topic_queries:
+            if date_query and topic_query:
+                sub_queries.append(f"({date_query}) AND ({topic_query})")
+            elif date_query or topic_query:
+                sub_queries.append(date_query or topic_query)
+    return sub_queries
+
+def _fetch_arxiv_page(query, offset, page_size):
+    """Fetches a single page of results for `query` starting at `offset` (blocking)."""
+    import arxiv
+    client = arxiv.Client(page_size=page_size, delay_seconds=ARXIV_REQUEST_INTERVAL, num_retries=3)
+    search = arxiv.Search(
+        query=query,
+        max_results=offset + page_size,
+        sort_by=arxiv.SortCriterion.SubmittedDate,
+        sort_order=arxiv.SortOrder.Descending
+    )
+    return list(client.results(search, offset=offset))
+
+def _fetch_arxiv_ids(start_date=None, end_date=None):
+    """Fetches the papers listed in ARXIV_IDS (blocking)."""
+    import arxiv
+    client = arxiv.Client(delay_seconds=ARXIV_REQUEST_INTERVAL)
+    search = arxiv.Search(
+        id_list=ARXIV_IDS,
+        max_results=MAX_RESULTS,
+        sort_by=arxiv.SortCriterion.SubmittedDate,
+        sort_order=arxiv.SortOrder.Descending
+    )
+    results = list(client.results(search))
+    if start_date is not None:
+        results = [r for r in results if start_date <= r.published.replace(tzinfo=None) <= end_date.replace(tzinfo=None)]
+    return results
+
+async def _iter_arxiv_results(start_date=None, end_date=None):
+    """
+    Asynchronously yields arXiv results for the configured search, de-duplicated by
+    version-less arxiv_id, as soon as each page arrives. Category/date sub-queries are paginated
+    concurrently while request starts respect ARXIV_REQUEST_INTERVAL.
+    Each sub-query returns at most its newest MAX_RESULTS papers, so every category and
+    date window is covered no matter which sub-queries answer first.
+    """
+    if ARXIV_IDS:
+        print(f"Fetching papers by IDs: {ARXIV_IDS}")
+        for result in await asyncio.to_thread(_fetch_arxiv_ids, start_date, end_date):
+            yield result
+        return
+
+    sub_queries = _build_sub_queries(start_date, end_date)
+    print(f"Fetching papers for {len(PROFILES)} profile(s) by {', '.join(_topic_queries(PROFILES))} "
+          f"({len(sub_queries)} sub-queries)")
+
+    rate_limiter = _AsyncRateLimiter(ARXIV_REQUEST_INTERVAL)
+    request_slots = asyncio.Semaphore(max(1, ARXIV_MAX_CONCURRENT_REQUESTS))
+    pages = asyncio.Queue()
+    _done = object()
+
+    async def paginate(query):
+        offset = 0
+        try:
+            while offset < MAX_RESULTS:
+                page_size = min(ARXIV_PAGE_SIZE, MAX_RESULTS - offset)
+                async with request_slots:
+                    await rate_limiter.wait()
+                    started_at = time.perf_counter()
+                    try:
+                        page = await asyncio.to_thread(_fetch_arxiv_page, query, offset, page_size)
+                    except Exception as e:
+                        print(f"Error fetching arXiv page (query: {query}, offset: {offset}): {e}")
+                        metrics.increment('arxiv_page_errors')
+                        return
+                    metrics.observe('arxiv_page', time.perf_counter() - started_at)
+                await pages.put(page)
+                if len(page) < page_size:
+                    return
+                offset += len(page)
+        finally:
+            await pages.put(_done)
+
+    tasks = [asyncio.create_task(paginate(query)) for query in sub_queries]
+    seen_ids = set()
+    remaining = len(tasks)
+    try:
+        while remaining:
+            page = await pages.get()
+            if page is _done:
+                remaining -= 1
+                continue
+            for result in page:
+                arxiv_id = normalize_arxiv_id(result.entry_id.split('/')[-1])
+                if arxiv_id in seen_ids:
+                    continue # Cross-listed paper already yielded by another category
+                seen_ids.add(arxiv_id)
+                yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def _format_scores(profile_scores):
+    if len(profile_scores) == 1:
+        return str(next(iter(profile_scores.values())))
+    return ", ".join(f"{name}={score}" for name, score in profile_scores.items())
+
+def _score_cache_id(paper):
+    """
+    ID under which a paper's relevance scores are cached. A 'revised' paper keeps its old
+    signature in the dedup index until it is analyzed again, so its scores are cached per
+    revision (hash of title + abstract) and are reused on later runs instead of re-scored.
+    """
+    if not paper.get('revised'):
+        return paper['arxiv_id']
+    digest = hashlib.sha256(f"{paper['title']}\n{paper['summary']}".encode('utf-8')).hexdigest()[:16]
+    return f"{paper['arxiv_id']}@{digest}"
+
+def _prefilter_for_profiles(papers):
+    """
+    Runs the TF-IDF pre-filter once per profile query and keeps the union of the
+    papers any profile would keep, best-ranked first. 'prefilter_similarity' is the
+    best similarity over all profiles.
+    """
+    from prefilter import prefilter_papers
+    kept_ids = {}
+    best_similarity = {}
+    for profile in PROFILES:
+        kept, _ = prefilter_papers(papers, query=profile.get('query') or '')
+        for rank, paper in enumerate(kept):
+            kept_ids[paper['arxiv_id']] = min(rank, kept_ids.get(paper['arxiv_id'], rank))
+        for paper in papers:
+            best_similarity[paper['arxiv_id']] = max(paper['prefilter_similarity'], best_similarity.get(paper['arxiv_id'], 0.0))
+    for paper in papers:
+        paper['prefilter_similarity'] = best_similarity[paper['arxiv_id']]
+    return sorted((paper for paper in papers if paper['arxiv_id'] in kept_ids), key=lambda paper: kept_ids[paper['arxiv_id']])
+
+async def fetch_latest_papers_async(analyzed_papers_info: dict = None):
     """
-    Fetches the latest papers from arXiv, gets their metadata, and scores their relevance.
-    PDF content is NOT downloaded at this stage.
-    Prioritizes fetching by specific arXiv IDs, then by categories, and finally by query.
+    Asynchronously fetches the latest papers from arXiv and scores their relevance.
+    PDF content is NOT downloaded at this stage. Only with PREFILTER_ENABLED off are metadata
+    records streamed into batched relevance scoring while the remaining pages are still being
+    fetched; the pre-filter (on by default) ranks the whole fetch, so scoring waits for it.
+    Every paper is scored against all PROFILES in the same requests: 'profile_scores'
+    maps profile names to scores and 'relevance_score' is the best of them.
+    With PREFILTER_ENABLED, unscored papers are first ranked by a local TF-IDF
+    pre-filter and only those in some profile's top PREFILTER_TOP_K are scored and returned.
+    A paper's 'relevance_score' is None if scoring it failed.
+    IDs are version-less. With DEDUP_ENABLED, near-duplicates of analyzed papers (or of
+    earlier papers in this fetch) are dropped before scoring, and analyzed papers whose
+    title and abstract changed are marked 'revised' so they are scored and analyzed again.
     """
     if analyzed_papers_info is None:
         analyzed_papers_info = {}
 
-    base_query = []
-
+    start_date = end_date = None
     # Add date range filter
     if DAYS_TO_FETCH_PAPERS > 0:
         today_midnight = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
         start_date = today_midnight - timedelta(days=DAYS_TO_FETCH_PAPERS)
         end_date = today_midnight - timedelta(seconds=1) # End of yesterday
-        date_query = f"submittedDate:[{start_date.strftime('%Y%m%d%H%M%S')} TO {end_date.strftime('%Y%m%d%H%M%S')}]"
-        base_query.append(date_query)
 
-    if ARXIV_IDS:
-        print(f"Fetching papers by IDs: {ARXIV_IDS}")
-        search = arxiv.Search(
-            id_list=ARXIV_IDS,
-            max_results=MAX_RESULTS,
-            sort_by=arxiv.SortCriterion.SubmittedDate,
-            sort_order=arxiv.SortOrder.Descending
-        )
-        results = list(search.results())
-        if DAYS_TO_FETCH_PAPERS > 0:
-            results = [r for r in results if start_date <= r.published.replace(tzinfo=None) <= end_date.replace(tzinfo=None)]
-
-    elif ARXIV_CATEGORIES:
-        category_query_str = " OR ".join([f"cat:{cat}" for cat in ARXIV_CATEGORIES])
-        if base_query:
-            final_query = f"({' AND '.join(base_query)}) AND ({category_query_str})"
-        else:
-            final_query = category_query_str
-        print(f"Fetching papers by categories: {ARXIV_CATEGORIES} (Query: {final_query})")
-        search = arxiv.Search(
-            query=final_query,
-            max_results=MAX_RESULTS,
-            sort_by=arxiv.SortCriterion.SubmittedDate,
-            sort_order=arxiv.SortOrder.Descending
-        )
-        results = search.results()
-    else:
-        if base_query:
-            final_query = f"({' AND '.join(base_query)}) AND ({ARXIV_QUERY})"
-        else:
-            final_query = ARXIV_QUERY
-        print(f"Fetching papers by query: {ARXIV_QUERY} (Query: {final_query})")
-        search = arxiv.Search(
-            query=final_query,
-            max_results=MAX_RESULTS,
-            sort_by=arxiv.SortCriterion.SubmittedDate,
-            sort_order=arxiv.SortOrder.Descending
+    papers_metadata = []
+    unscored_papers = []
+    prefilter_candidates = []
+    scoring_tasks = []
+    cache_keys = {profile['name']: get_scoring_cache_key(profile) for profile in PROFILES}
+    score_ttl_seconds = SCORE_CACHE_TTL_DAYS * 24 * 3600
+    detector = None
+    if DEDUP_ENABLED:
+        from dedup import DuplicateDetector
+        detector = DuplicateDetector()
+    evicted = evict_expired_scores(score_ttl_seconds)
+    if evicted:
+        print(f"Evicted {evicted} expired cached relevance scores.")
+
+    def set_profile_scores(paper, profile_scores):
+        paper['profile_scores'] = profile_scores
+        # The overall score (best match over all profiles) orders the shared analysis work.
+        paper['relevance_score'] = max(profile_scores.values()) if profile_scores else None
+
+    def get_cached_profile_scores(cache_ids):
+        # One lookup per profile for the whole group; a paper counts as cached only if every profile has a score.
+        profile_scores = {cache_id: {} for cache_id in cache_ids}
+        for name, (criteria_hash, model_name) in cache_keys.items():
+            cached = get_cached_scores(cache_ids, criteria_hash, model_name, score_ttl_seconds)
+            for cache_id, scores in profile_scores.items():
+                if cache_id in cached:
+                    scores[name] = cached[cache_id]
+        return {cache_id: scores for cache_id, scores in profile_scores.items() if len(scores) == len(cache_keys)}
+
+    async def score_batch(batch):
+        started_at = time.perf_counter()
+        results = await asyncio.to_thread(
+            score_papers_for_profiles, [(paper['title'], paper['summary']) for paper in batch], PROFILES
         )
-        results = search.results()
+        metrics.observe('scoring', time.perf_counter() - started_at)
+        metrics.increment('papers_scored', sum(scores is not None for scores in results))
+        metrics.increment('scoring_failures', sum(scores is None for scores in results))
+        # Only successful scores are cached, so failed papers are retried next run. A revised
+        # paper's scores are also cached under its plain ID, used once it is analyzed and re-indexed.
+        scored = [(paper, scores) for paper, scores in zip(batch, results) if scores is not None]
+        for name, (criteria_hash, model_name) in cache_keys.items():
+            to_save = {paper['arxiv_id']: scores[name] for paper, scores in scored}
+            to_save.update((_score_cache_id(paper), scores[name]) for paper, scores in scored if paper.get('revised'))
+            await asyncio.to_thread(save_scores, to_save, criteria_hash, model_name)
+        for paper, scores in zip(batch, results):
+            if scores is None:
+                set_profile_scores(paper, {})
+                print(f"  Scoring failed for '{paper['title']}' (ID: {paper['arxiv_id']})")
+            else:
+                set_profile_scores(paper, scores)
+                print(f"  Scored relevance for '{paper['title']}' (ID: {paper['arxiv_id']}): {_format_scores(scores)}")
+
+    def classify(papers):
+        # Splits fetched papers into cached (or stored) scores, pre-filter candidates and scoring batches.
+        nonlocal unscored_papers
+        # A revised abstract needs a fresh score, cached under its revision.
+        cached = get_cached_profile_scores([_score_cache_id(paper) for paper in papers])
+        for paper in papers:
+            arxiv_id = paper['arxiv_id']
+            cached_scores = cached.get(_score_cache_id(paper))
+            if cached_scores is not None:
+                set_profile_scores(paper, cached_scores)
+                print(f"  Using cached relevance score for '{paper['title']}' (ID: {arxiv_id}): {_format_scores(cached_scores)}")
+            elif arxiv_id in analyzed_papers_info and len(PROFILES) == 1 and not paper.get('revised'):
+                # Use stored relevance score if available
+                _, stored_score = analyzed_papers_info[arxiv_id]
+                set_profile_scores(paper, {PROFILES[0]['name']: stored_score})
+                print(f"  Using stored relevance score for '{paper['title']}' (ID: {arxiv_id}): {stored_score}")
+            elif PREFILTER_ENABLED:
+                # Ranking needs the whole candidate set, so scoring starts after the fetch.
+                prefilter_candidates.append(paper)
+                continue
+            else:
+                unscored_papers.append(paper)
+                if len(unscored_papers) >= SCORING_BATCH_SIZE:
+                    scoring_tasks.append(asyncio.create_task(score_batch(unscored_papers)))
+                    unscored_papers = []
+            papers_metadata.append(paper)
+
+    # Cached scores are looked up for SCORING_BATCH_SIZE papers at a time rather than one by one.
+    fetched = []
+    from tqdm import tqdm
+    progress = tqdm(desc="Fetching paper metadata")
+    try:
+        async for result in _iter_arxiv_results(start_date, end_date):
+            arxiv_id = normalize_arxiv_id(result.entry_id.split('/')[-1])
+            progress.set_postfix(title=result.title, id=arxiv_id, refresh=False)
+            progress.update(1)
+            paper = {
+                'arxiv_id': arxiv_id,
+                'title': result.title,
+                'summary': result.summary,
+                'pdf_url': result.pdf_url,
+                'published': result.published,
+                'relevance_score': 0,
+                'profile_scores': {},
+                'authors': [author.name for author in result.authors] # Extract author names
+            }
+            if detector is not None:
+                status, other_id, similarity = detector.check(paper)
+                if status == 'duplicate':
+                    print(f"  Skipping near-duplicate '{result.title}' (ID: {arxiv_id}) of {other_id} (similarity {similarity:.2f})")
+                    metrics.increment('near_duplicates')
+                    continue
+                if status == 'revised':
+                    print(f"  '{result.title}' (ID: {arxiv_id}) changed since it was analyzed (similarity {similarity:.2f}); re-scoring it.")
+                    metrics.increment('revised_papers')
+                    paper['revised'] = True
+            fetched.append(paper)
+            if len(fetched) >= SCORING_BATCH_SIZE:
+                classify(fetched)
+                fetched = []
+    finally:
+        progress.close()
+    classify(fetched)
+
+    if prefilter_candidates:
+        kept = _prefilter_for_profiles(prefilter_candidates)
+        print(f"Pre-filter kept {len(kept)} of {len(prefilter_candidates)} unscored papers for Gemini scoring "
+              f"(top {PREFILTER_TOP_K} per profile, similarity >= {PREFILTER_MIN_SIMILARITY}).")
+        papers_metadata.extend(kept)
+        for start in range(0, len(kept), SCORING_BATCH_SIZE):
+            scoring_tasks.append(asyncio.create_task(score_batch(kept[start:start + SCORING_BATCH_SIZE])))
+
+    if unscored_papers:
+        scoring_tasks.append(asyncio.create_task(score_batch(unscored_papers)))
+    if scoring_tasks:
+        print(f"Waiting for {len(scoring_tasks)} relevance scoring batch(es) of up to {SCORING_BATCH_SIZE} papers...")
+        await asyncio.gather(*scoring_tasks)
+
+    # Papers whose scoring failed (None) sort after every successfully scored paper.
+    papers_metadata.sort(
+        key=lambda x: (x['relevance_score'] is not None, x['relevance_score'] or 0, x['published']), reverse=True
+    )
 
-    papers_metadata = []
-    tqdm_results = tqdm(results, desc="Fetching paper metadata and scoring relevance")
-    for result in tqdm_results:
-        arxiv_id = result.entry_id.split('/')[-1]
-        tqdm_results.set_postfix(title=result.title, id=arxiv_id, refresh=True)
-        if arxiv_id in analyzed_papers_info:
-            # Use stored relevance score if available
-            _, relevance_score = analyzed_papers_info[arxiv_id]
-            print(f"  Using stored relevance score for '{result.title}' (ID: {arxiv_id}): {relevance_score}")
-        else:
-            relevance_score = score_paper_relevance(result.title, result.summary)
-            print(f"  Scored relevance for '{result.title}' (ID: {arxiv_id}): {relevance_score}")
-
-        papers_metadata.append({
-            'arxiv_id': arxiv_id,
-            'title': result.title,
-            'summary': result.summary,
-            'pdf_url': result.pdf_url,
-            'published': result.published,
-            'relevance_score': relevance_score,
-            'authors': [author.name for author in result.authors] # Extract author names
-        })
-    
-    papers_metadata.sort(key=lambda x: (x['relevance_score'], x['published']), reverse=True)
-    
     return papers_metadata
 
+def fetch_latest_papers(analyzed_papers_info: dict = None):
+    """
+    Fetches the latest papers from arXiv, gets their metadata, and scores their relevance
+    against every profile. PDF content is NOT downloaded at this stage.
+    If ARXIV_IDS is set, exactly those papers are fetched. Otherwise the search of all PROFILES
+    is split into sub-queries, one per category in the union of their categories (or keyword
+    query of a profile without categories) and per date window, which are paginated
+    concurrently; each returns at most its newest MAX_RESULTS papers, de-duplicated by
+    version-less ID across sub-queries.
+    With PREFILTER_ENABLED (the default) scoring starts once the whole fetch is in, since the
+    pre-filter ranks all candidates; only with it off do papers stream into scoring batches
+    while later pages are still being fetched.
+    """
+    return asyncio.run(fetch_latest_papers_async(analyzed_papers_info))
+
 if __name__ == '__main__':
     latest_papers_metadata = fetch_latest_papers({}) # Pass an empty dict for testing
     for paper in latest_papers_metadata:
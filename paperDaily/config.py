@@ -1,4 +1,5 @@
 
+import json
 import os
 from dotenv import load_dotenv
 
@@ -6,19 +7,144 @@ load_dotenv()
 
 # arXiv search settings
 ARXIV_QUERY = '"large language model" OR "LLM" OR "transformer" OR "natural language processing" OR "NLP" OR "artificial intelligence" OR "AI" OR "reinforcement learning" OR "world model" OR "visual pre-training" OR "ViT" OR "Vision-Language-Action Model"'
-MAX_RESULTS = 20
+MAX_RESULTS = 20 # Newest papers fetched per category and date window (per ARXIV_IDS query when set)
 ARXIV_IDS = [] # Optional: List of specific arXiv IDs to fetch, e.g., ["2301.00001", "2302.00002"]
 ARXIV_CATEGORIES = ['cs.AI', 'cs.CL', 'cs.LG', 'stat.ML'] # Optional: List of arXiv categories to filter by
 MAX_NEW_PAPERS_TO_ANALYZE = 5 # Maximum number of *new* papers to analyze in a single run
 DAYS_TO_FETCH_PAPERS = 7 # Number of days back from the current date to fetch papers (e.g., 1 for yesterday and today)
 
+# arXiv API fetching settings (queries are split per category and per date window)
+ARXIV_PAGE_SIZE = 100 # Results requested per arXiv API page
+ARXIV_REQUEST_INTERVAL = 3.0 # Minimum seconds between arXiv API requests (arXiv Terms of Use)
+ARXIV_MAX_CONCURRENT_REQUESTS = 2 # arXiv API requests allowed in flight at once
+ARXIV_DATE_WINDOW_DAYS = 1 # Size of each date window the fetch range is split into
+
+# Local TF-IDF pre-filter run on CPU before LLM relevance scoring
+PREFILTER_ENABLED = True # Rank unscored papers against ARXIV_QUERY and only send the best to Gemini
+PREFILTER_TOP_K = 100 # Max papers per run passed on to Gemini scoring (None = no limit)
+PREFILTER_MIN_SIMILARITY = 0.02 # Minimum TF-IDF cosine similarity to ARXIV_QUERY's terms
+
+# Duplicate detection: arXiv IDs are compared without their version suffix (2401.00001v2 -> 2401.00001),
+# and MinHash signatures of title + abstract, banded into an LSH index in the state store, catch papers
+# re-posted under a new ID and tell a real revision from a version bump with the same content
+DEDUP_ENABLED = True
+DEDUP_SIMILARITY_THRESHOLD = 0.8 # Estimated Jaccard similarity (word 3-grams) from which two papers count as the same
+DEDUP_NUM_PERM = 128 # MinHash permutations per signature
+DEDUP_LSH_BANDS = 16 # LSH bands; must divide DEDUP_NUM_PERM (more bands find less similar candidates)
+
+# Relevance scoring settings
+SCORING_BATCH_SIZE = 20 # Number of papers scored in a single Gemini request
+SCORING_MAX_RETRIES = 2 # Extra attempts for papers missing from (or malformed in) a batch reply
+SCORE_CACHE_TTL_DAYS = 30 # Cached scores (per paper, search criteria and model) expire after this many days
+
+# Full-text analysis prompt settings
+ANALYSIS_PROMPT_TOKEN_BUDGET = 60000 # Estimated tokens per analysis prompt; low-value sections are dropped/compressed to fit
+SECTION_MIN_KEEP_CHARS = 1500 # Characters always kept from the start of a compressed section
+
+# Streamed analyses are written to the state store chunk by chunk; a broken stream is continued
+# from the saved text instead of being regenerated, and kept as a partial analysis if that fails too
+ANALYSIS_STREAM_MAX_RESUMES = 2 # Continuation requests after a stream breaks midway
+
+# Analysis pipeline settings (download -> PDF text extraction -> Gemini analysis)
+PDF_DOWNLOAD_WORKERS = 8 # Concurrent PDF downloads
+PDF_EXTRACT_WORKERS = min(4, os.cpu_count() or 1) # PyMuPDF extraction processes
+ANALYSIS_WORKERS = 4 # Concurrent Gemini analysis calls
+PIPELINE_QUEUE_SIZE = 8 # Max items buffered between stages (bounds PDFs held in memory)
+
+# PDF text extraction budgets (None = unlimited); extraction stops early once any is reached
+EXTRACT_MAX_PAGES = 60 # Pages read per document (skips long appendices / theses)
+EXTRACT_MAX_CHARS = 400000 # Characters kept per document
+EXTRACT_MAX_RSS_MB = 1536 # Abort a document if the extracting process grows beyond this RSS
+
+# On-disk cache of downloaded PDFs and extracted text (keyed by arXiv ID or content hash)
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", "pdf_cache")
+PDF_CACHE_MAX_MB = 1024 # Least-recently-used entries are evicted beyond this size
+
+# State store (SQLite, WAL mode) holding analyzed papers, scores, analyses and email status
+PAPER_STORE_FILE = os.getenv("PAPER_STORE_FILE", "papers.db")
+ANALYZED_PAPERS_FILE = os.getenv("ANALYZED_PAPERS_FILE", "analyzed_papers.txt") # Legacy txt list, migrated once into the store
+CHECKPOINT_RESUME_HOURS = 24 # An unfinished job run younger than this is resumed by the next job instead of starting over
+CHECKPOINT_RETENTION_DAYS = 30 # Checkpoint journals of finished runs are deleted after this many days
+
+# Run instrumentation: per-stage timings and counters for every job
+METRICS_LOG_FILE = os.getenv("METRICS_LOG_FILE", "metrics.jsonl") # JSON-lines event log ("" disables)
+METRICS_PROM_FILE = os.getenv("METRICS_PROM_FILE") # Optional node_exporter textfile, e.g. /var/lib/node_exporter/paperdaily.prom
+
 # Email settings loaded from environment variables
 SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
 SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "true").lower() not in ("0", "false", "no") # STARTTLS before login
 SENDER_EMAIL = os.getenv("SENDER_EMAIL")
 RECEIVER_EMAILS_STR = os.getenv("RECEIVER_EMAILS")
 RECEIVER_EMAIL = [email.strip() for email in RECEIVER_EMAILS_STR.split(',')] if RECEIVER_EMAILS_STR else []
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
 
+# Email delivery: queued digests are sent from a persisted outbox over one reused SMTP session
+SMTP_TIMEOUT = 60 # Seconds for SMTP connect and commands
+SMTP_MAX_MESSAGES_PER_SESSION = 100 # Reconnect after this many messages (many servers cap a session)
+SMTP_MAX_RECONNECTS = 2 # Reconnect attempts when the session drops in the middle of a batch
+EMAIL_MAX_ATTEMPTS = 3 # Delivery attempts per queued message before its papers are put into a new digest
+EMAIL_PER_RECIPIENT = os.getenv("EMAIL_PER_RECIPIENT", "false").lower() in ("1", "true", "yes") # One personal message per recipient instead of one shared To: list
+EMAIL_ASYNC = os.getenv("EMAIL_ASYNC", "false").lower() in ("1", "true", "yes") # Send digests from a background thread while analysis continues
+
+# Scheduler: each profile's digest runs on a cron schedule ("minute hour day-of-month month day-of-week",
+# local time). Runs never overlap: they take SCHEDULER_LOCK_FILE and execute in a fresh worker process.
+SCHEDULE_CRON = os.getenv("SCHEDULE_CRON", "0 8 * * *") # Default schedule of profiles without a 'schedule' key
+SCHEDULE_CATCHUP_HOURS = 24 # A run missed while the scheduler was down is made up at startup if it is at most this old
+SCHEDULER_LOCK_FILE = os.getenv("SCHEDULER_LOCK_FILE", "paperdaily.lock")
+
+# Subscriber profiles, each with its own digest. Papers are fetched once for the union of all
+# profiles, scored against every profile in one batched pass and analyzed at most once.
+PROFILES = [
+    {
+        'name': 'default',
+        'query': ARXIV_QUERY,
+        'categories': ARXIV_CATEGORIES,
+        'min_score': 0, # Papers scoring below this never go into the profile's digest
+        'max_papers': MAX_NEW_PAPERS_TO_ANALYZE, # New papers per digest
+        'recipients': RECEIVER_EMAIL,
+        'schedule': SCHEDULE_CRON, # Cron expression; profiles sharing a trigger time run as one job
+    },
+]
+PROFILES_FILE = os.getenv("PROFILES_FILE") # Optional JSON list of profiles replacing PROFILES; missing keys use the defaults above
+if PROFILES_FILE:
+    with open(PROFILES_FILE, 'r', encoding='utf-8') as f:
+        PROFILES = [{**PROFILES[0], **profile} for profile in json.load(f)]
+
 # Gemini API settings loaded from environment variables
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+MODEL_NAME = os.getenv("MODEL_NAME", "gemini-2.5-flash")
+
+# Gemini client rate limits and retry policy (shared by all concurrent callers)
+GEMINI_REQUESTS_PER_MINUTE = int(os.getenv("GEMINI_REQUESTS_PER_MINUTE", 60)) # 0 disables the limit
+GEMINI_TOKENS_PER_MINUTE = int(os.getenv("GEMINI_TOKENS_PER_MINUTE", 1000000)) # Estimated prompt tokens; 0 disables the limit
+GEMINI_MAX_RETRIES = 5 # Retries for rate-limit (429) and transient server errors
+GEMINI_RETRY_BASE_DELAY = 1.0 # Seconds; doubled on every retry, with full jitter
+GEMINI_RETRY_MAX_DELAY = 60.0 # Upper bound on a single backoff delay in seconds
+
+# Map-reduce analysis of long papers: the text is split into section-aligned chunks that are
+# summarised in parallel by a cheaper model (map), then one call writes the structured report
+# from the chunk summaries (reduce). Off by default: it is not faster unless all chunks of a
+# paper fit into one map round (MAP_REDUCE_MAX_PARALLEL), so enable it for its coverage of long papers
+MAP_REDUCE_MIN_TOKENS = int(os.getenv("MAP_REDUCE_MIN_TOKENS", 0)) # Papers above this many estimated tokens use map-reduce (e.g. 30000, roughly 30 pages); 0 disables it
+MAP_REDUCE_CHUNK_TOKENS = 8000 # Target estimated tokens per chunk
+MAP_REDUCE_MAX_PARALLEL = 4 # Chunk summaries of one paper requested concurrently (fan-out)
+MAP_REDUCE_MAP_MODEL = os.getenv("MAP_REDUCE_MAP_MODEL", "gemini-2.5-flash-lite") # Model for the chunk summaries
+MAP_REDUCE_REDUCE_MODEL = os.getenv("MAP_REDUCE_REDUCE_MODEL", MODEL_NAME) # Model for the final report
+
+# Context caching: the fixed instructions of the analysis, chunk summary and scoring prompts are sent
+# as a prefix separate from the per-paper text; prefixes of at least CONTEXT_CACHE_MIN_TOKENS are
+# uploaded once per run as a Gemini cached content and referenced by every call instead of resent
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CONTEXT_CACHE_MIN_TOKENS = 1024 # Smaller prefixes are sent inline (the API rejects caches below the model's minimum)
+CONTEXT_CACHE_TTL_MINUTES = 60 # Lifetime of a cache; it is refreshed if a run outlasts it
+
+# Deferred analysis: with ANALYSIS_MODE=batch the night's analyses are submitted as one Gemini batch
+# job (discounted, outside the interactive rate limits) and collected before the digest goes out.
+# Whatever is not done by the deadline, and papers long enough for map-reduce, is analyzed interactively.
+# The deadline is ANALYSIS_BATCH_WAIT_MINUTES after the run starts, so it fits any SCHEDULE_CRON; with a fixed
+# ANALYSIS_BATCH_DEADLINE, a run that starts after that day's deadline skips batch mode.
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "interactive") # "interactive" (streaming) or "batch"
+ANALYSIS_BATCH_DEADLINE = os.getenv("ANALYSIS_BATCH_DEADLINE", "") # Optional local HH:MM by which the batch must be done
+ANALYSIS_BATCH_POLL_SECONDS = 60 # Interval between batch job status checks
+ANALYSIS_BATCH_WAIT_MINUTES = int(os.getenv("ANALYSIS_BATCH_WAIT_MINUTES", 90)) # Deadline after the run's start, without ANALYSIS_BATCH_DEADLINE
@@ -0,0 +1,94 @@
+import hashlib
+import re
+import zlib
+import numpy as np
+from config import DEDUP_SIMILARITY_THRESHOLD, DEDUP_NUM_PERM, DEDUP_LSH_BANDS
+from paper_store import get_dedup_signatures, find_dedup_candidates, save_dedup_signature
+
+_WORD_RE = re.compile(r'\w+')
+_SHINGLE_SIZE = 3 # Words per shingle
+_MERSENNE_PRIME = (1 << 31) - 1
+
+# Fixed seed: signatures stored in the index must stay comparable across runs.
+_rng = np.random.default_rng(20240101)
+_PERM_A = _rng.integers(1, _MERSENNE_PRIME, DEDUP_NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, _MERSENNE_PRIME, DEDUP_NUM_PERM, dtype=np.uint64)
+_ROWS_PER_BAND = DEDUP_NUM_PERM // DEDUP_LSH_BANDS
+
+
+def minhash_signature(text):
+    """
+    Returns the MinHash signature (DEDUP_NUM_PERM uint32 values) of the word 3-gram shingles
+    of `text`, computed with universal hashing (a*x + b) mod 2^31-1 vectorised over all shingles.
+    """
+    words = _WORD_RE.findall(text.lower())
+    shingles = {' '.join(words[i:i + _SHINGLE_SIZE]) for i in range(max(1, len(words) - _SHINGLE_SIZE + 1))}
+    hashes = np.fromiter(
+        (zlib.crc32(shingle.encode('utf-8')) % _MERSENNE_PRIME for shingle in shingles), dtype=np.uint64, count=len(shingles)
+    )
+    permuted = (_PERM_A[:, None] * hashes[None, :] + _PERM_B[:, None]) % _MERSENNE_PRIME
+    return permuted.min(axis=1).astype(np.uint32)
+
+def estimate_similarity(signature, other):
+    """Estimated Jaccard similarity of two signatures: the share of equal MinHash values."""
+    if len(signature) != len(other):
+        return 0.0 # Signed with a different DEDUP_NUM_PERM
+    return float(np.count_nonzero(signature == other)) / len(signature)
+
+def _band_buckets(signature):
+    """(band, bucket) pairs of the LSH index: each band of rows hashed to a signed 64-bit integer."""
+    return [
+        (band, int.from_bytes(hashlib.blake2b(rows.tobytes(), digest_size=8).digest(), 'big', signed=True))
+        for band, rows in enumerate(signature[:_ROWS_PER_BAND * DEDUP_LSH_BANDS].reshape(DEDUP_LSH_BANDS, _ROWS_PER_BAND))
+    ]
+
+def _paper_text(paper):
+    return f"{paper['title']} {paper['summary']}"
+
+def index_paper(paper):
+    """Adds an analyzed paper's title + abstract signature to the persistent near-duplicate index."""
+    signature = minhash_signature(_paper_text(paper))
+    save_dedup_signature(paper['arxiv_id'], signature.tobytes(), _band_buckets(signature))
+
+class DuplicateDetector:
+    """
+    Classifies the papers of one fetch against the persistent index (papers analyzed before)
+    and against the papers already seen in this fetch. Candidate lookups go through the LSH
+    buckets, so each check costs a few indexed queries regardless of the history size.
+    """
+
+    def __init__(self, threshold=DEDUP_SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self._signatures = {} # arxiv_id -> signature of papers seen in this fetch
+        self._buckets = {} # (band, bucket) -> arxiv_ids seen in this fetch
+
+    def check(self, paper):
+        """
+        Returns (status, other_id, similarity). Status is:
+        'new' - not seen before; 'same' - an indexed paper with this ID and (nearly) the same
+        content, e.g. a version bump; 'revised' - an indexed paper with this ID whose content
+        changed; 'duplicate' - near-duplicate of another paper, `other_id`.
+        """
+        arxiv_id = paper['arxiv_id']
+        signature = minhash_signature(_paper_text(paper))
+        stored = get_dedup_signatures([arxiv_id]).get(arxiv_id)
+        if stored is not None:
+            similarity = estimate_similarity(signature, np.frombuffer(stored, dtype=np.uint32))
+            return ('same' if similarity >= self.threshold else 'revised'), arxiv_id, similarity
+
+        band_buckets = _band_buckets(signature)
+        local_candidates = {other for key in band_buckets for other in self._buckets.get(key, ())}
+        candidates = find_dedup_candidates(band_buckets) - {arxiv_id}
+        stored_signatures = get_dedup_signatures(sorted(candidates - local_candidates))
+        for other_id in sorted(local_candidates) + sorted(stored_signatures):
+            other = self._signatures.get(other_id)
+            if other is None:
+                other = np.frombuffer(stored_signatures[other_id], dtype=np.uint32)
+            similarity = estimate_similarity(signature, other)
+            if other_id != arxiv_id and similarity >= self.threshold:
+                return 'duplicate', other_id, similarity
+
+        self._signatures[arxiv_id] = signature
+        for key in band_buckets:
+            self._buckets.setdefault(key, []).append(arxiv_id)
+        return 'new', None, 0.0
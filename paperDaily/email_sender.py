@@ -1,119 +1,247 @@
-
 import smtplib
 import ssl
+import threading
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-import re
-from config import SENDER_EMAIL, RECEIVER_EMAIL, EMAIL_PASSWORD, SMTP_SERVER, SMTP_PORT
+from html import escape
+from config import (
+    SENDER_EMAIL, RECEIVER_EMAIL, EMAIL_PASSWORD, SMTP_SERVER, SMTP_PORT, SMTP_USE_TLS, SMTP_TIMEOUT,
+    SMTP_MAX_MESSAGES_PER_SESSION, SMTP_MAX_RECONNECTS, EMAIL_MAX_ATTEMPTS, EMAIL_PER_RECIPIENT
+)
+from paper_store import enqueue_digest, get_queued_emails, record_email_attempt
+from markdown_renderer import render_markdown
+import metrics
+
+# Errors after which the session is re-established and the message sent again.
+_RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
 
-def send_email(subject, html_content):
+class EmailNotConfiguredError(Exception):
+    """Raised when no sender address is configured."""
+
+class SmtpSession:
     """
-    Sends an email with the given subject and HTML content.
+    One authenticated SMTP session reused for many messages. The connection (and
+    STARTTLS/login) is opened lazily, renewed after SMTP_MAX_MESSAGES_PER_SESSION
+    messages, and re-established up to SMTP_MAX_RECONNECTS times if it drops.
     """
-    if not SENDER_EMAIL or SENDER_EMAIL == "your_email@gmail.com":
-        print("Email not sent. Please configure sender and receiver emails in config.py")
-        return
 
+    def __init__(self):
+        self._smtp = None
+        self._sent_in_session = 0
+
+    def _connect(self):
+        if not SENDER_EMAIL or SENDER_EMAIL == "your_email@gmail.com":
+            raise EmailNotConfiguredError("Please configure sender and receiver emails in config.py")
+        smtp = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        try:
+            if SMTP_USE_TLS:
+                smtp.starttls(context=ssl.create_default_context())
+            if EMAIL_PASSWORD:
+                smtp.login(SENDER_EMAIL, EMAIL_PASSWORD)
+        except Exception:
+            smtp.close()
+            raise
+        metrics.increment('smtp_connections')
+        self._smtp, self._sent_in_session = smtp, 0
+
+    def send(self, message, recipients):
+        """Sends one message, reconnecting if the session has dropped. Raises on failure."""
+        if self._smtp is not None and self._sent_in_session >= SMTP_MAX_MESSAGES_PER_SESSION:
+            self.close()
+        for attempt in range(SMTP_MAX_RECONNECTS + 1):
+            if self._smtp is None:
+                self._connect()
+            try:
+                self._smtp.sendmail(SENDER_EMAIL, recipients, message.as_string())
+                self._sent_in_session += 1
+                return
+            except _RECONNECT_ERRORS as e:
+                self._drop()
+                if attempt == SMTP_MAX_RECONNECTS:
+                    raise
+                metrics.increment('smtp_reconnects')
+                print(f"SMTP session dropped ({e}); reconnecting (attempt {attempt + 2}/{SMTP_MAX_RECONNECTS + 1}).")
+
+    def _drop(self):
+        try:
+            self._smtp.close()
+        except Exception:
+            pass
+        self._smtp = None
+
+    def close(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except Exception:
+            pass
+        self._smtp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _build_message(subject, html_content, recipients):
     message = MIMEMultipart("alternative")
     message["Subject"] = subject
     message["From"] = SENDER_EMAIL
-    message["To"] = ", ".join(RECEIVER_EMAIL) # Join multiple recipients with a comma
+    message["To"] = ", ".join(recipients) # Join multiple recipients with a comma
 
     # Attach HTML content
     message.attach(MIMEText(html_content, "html"))
+    return message
 
+def send_email(subject, html_content, recipients=None):
+    """
+    Sends an email with the given subject and HTML content to `recipients`
+    (defaults to RECEIVER_EMAIL). Returns True if the email was sent successfully.
+    """
+    recipients = recipients or RECEIVER_EMAIL
     try:
-        context = ssl.create_default_context()
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls(context=context)
-            server.login(SENDER_EMAIL, EMAIL_PASSWORD)
-            server.sendmail(SENDER_EMAIL, RECEIVER_EMAIL, message.as_string()) # Pass the list of receivers
+        with SmtpSession() as session:
+            session.send(_build_message(subject, html_content, recipients), recipients)
         print("Email sent successfully!")
+        return True
+    except EmailNotConfiguredError as e:
+        print(f"Email not sent. {e}")
+        return False
     except Exception as e:
         print(f"Failed to send email: {e}")
+        return False
+
+def queue_digest(profile, subject, html_content, recipients, arxiv_ids):
+    """
+    Adds a digest to the persisted outbox: one message for all `recipients`, or one per
+    recipient with EMAIL_PER_RECIPIENT. It is sent by the next deliver_outbox() call.
+    """
+    recipients = recipients or RECEIVER_EMAIL
+    recipient_groups = [[recipient] for recipient in recipients] if EMAIL_PER_RECIPIENT else [list(recipients)]
+    return enqueue_digest(profile, subject, html_content, recipient_groups, arxiv_ids)
+
+def deliver_outbox(session=None, on_digest_done=None):
+    """
+    Sends every queued outbox message over one SMTP session (or `session`).
+    `on_digest_done(email, status)` is called when the last message of a digest has
+    been sent ('sent') or given up on ('failed'). Returns (sent, failed) message counts.
+    """
+    emails = get_queued_emails()
+    if not emails:
+        return 0, 0
+    sent_count = failed_count = 0
+    owns_session = session is None
+    session = session or SmtpSession()
+    try:
+        for email in emails:
+            error = None
+            try:
+                session.send(_build_message(email['subject'], email['html'], email['recipients']), email['recipients'])
+            except Exception as e:
+                error = str(e)
+                print(f"Failed to send '{email['subject']}' to {', '.join(email['recipients'])}: {e}")
+            if error is None:
+                sent_count += 1
+            else:
+                failed_count += 1
+            digest_status = record_email_attempt(email, error is None, error, EMAIL_MAX_ATTEMPTS)
+            if digest_status is not None and on_digest_done is not None:
+                on_digest_done(email, digest_status)
+    finally:
+        if owns_session:
+            session.close()
+    metrics.increment('emails_sent', sent_count)
+    metrics.increment('emails_failed', failed_count)
+    print(f"Outbox: sent {sent_count} message(s), {failed_count} failed.")
+    return sent_count, failed_count
+
+class OutboxSender:
+    """
+    Background thread that delivers outbox messages as soon as they are queued, over
+    one SMTP session kept open between batches, so sending overlaps with analysis.
+    """
+
+    def __init__(self, on_digest_done=None):
+        self.on_digest_done = on_digest_done
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="outbox-sender", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def notify(self):
+        """Wakes the sender after new messages were queued."""
+        self._wakeup.set()
+
+    def close(self):
+        """Delivers everything still queued and stops the thread."""
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join()
+
+    def _run(self):
+        with SmtpSession() as session:
+            while True:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                stopping = self._stopping
+                try:
+                    deliver_outbox(session, self.on_digest_done)
+                except Exception as e:
+                    print(f"Error delivering outbox: {e}")
+                if stopping:
+                    break
 
 def format_papers_to_html(analyzed_papers, subject="Daily arXiv Paper Digest"):
     """
-    Formats the list of analyzed papers into an HTML string, converting markdown-like syntax to HTML.
+    Formats the list of analyzed papers into an HTML string, rendering each Markdown
+    analysis in a single pass unless its 'analysis_html' was already rendered while it
+    streamed. Titles, summaries, authors and URLs are HTML-escaped.
     """
-    html = f"<html><head><style>body {{ font-family: sans-serif; }} h1, h2, h3 {{ color: #333; }} a {{ color: #1a73e8; text-decoration: none; }} hr {{ border: 0; border-top: 1px solid #eee; }}</style></head><body><h1>{subject}</h1>"
+    parts = [
+        "<html><head><style>body { font-family: sans-serif; } h1, h2, h3 { color: #333; } "
+        "a { color: #1a73e8; text-decoration: none; } hr { border: 0; border-top: 1px solid #eee; }</style></head>"
+        f"<body><h1>{escape(subject)}</h1>\n"
+    ]
 
     if len(analyzed_papers) > 1:
-        html += "<h2>论文清单:</h2>"
-        html += "<ol>"
-        for idx, paper in enumerate(analyzed_papers):
-            arxiv_id = paper.get('arxiv_id', 'N/A')
-            html += f"<li><strong>{paper['title']}</strong> (ID: {arxiv_id})</li>"
-        html += "</ol>"
-        html += "<hr>"
+        parts.append("<h2>论文清单:</h2><ol>\n")
+        for paper in analyzed_papers:
+            parts.append(f"<li><strong>{escape(paper['title'])}</strong> (ID: {escape(str(paper.get('arxiv_id', 'N/A')))})</li>\n")
+        parts.append("</ol><hr>\n")
+
     for i, paper in enumerate(analyzed_papers):
-        is_single_pdf = paper.get('relevance_score') == 'N/A'
-
-        if is_single_pdf:
-            html += f"<h2>{paper['title']}</h2>"
-            display_path = paper['pdf_url'].replace('file://', '')
-            html += f"<p><strong>File Path:</strong> <a href='{paper['pdf_url']}'>{display_path}</a></p>"
-        else:
-            html += f"<h2>{i+1}. <a href='{paper['pdf_url']}'>{paper['title']}</a> (Relevance Score: {paper.get('relevance_score', 'N/A')})</h2>"
-
-        if paper.get('authors') and paper.get('authors') != ['N/A']:
-            html += f"<p><strong>Authors:</strong> {', '.join(paper['authors'])}</p>"
-        
-        if not is_single_pdf:
-            html += "<h3>Summary:</h3>"
-            html += f"<p>{paper['summary']}</p>"
-
-        html += "<h3>Analysis:</h3>"
-        
-        analysis_content = paper['analysis']
-        
-        # Convert markdown bold to HTML strong
-        analysis_content = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', analysis_content)
-        
-        # Convert markdown headings to HTML headings (more robustly)
-        def replace_heading(match):
-            num_hashes = len(match.group(1))
-            content = match.group(2).strip()
-            if num_hashes == 1:
-                return f'<h1>{content}</h1>'
-            elif num_hashes == 2:
-                return f'<h2>{content}</h2>'
-            elif num_hashes == 3:
-                return f'<h3>{content}</h3>'
-            else: # For more than 3 hashes, default to h3
-                return f'<h3>{content}</h3>'
-
-        analysis_content = re.sub(r'^(#+)\s*(.*)$', replace_heading, analysis_content, flags=re.MULTILINE)
-
-        # Convert markdown unordered lists to HTML ul/li
-        # This is a bit more complex as it needs to handle multiple lines.
-        # A simple approach: replace leading '* ' with <li> and wrap in <ul>
-        lines = analysis_content.split('\n')
-        formatted_lines = []
-        in_list = False
-        for line in lines:
-            if line.strip().startswith('- ') or line.strip().startswith('* '):
-                if not in_list:
-                    formatted_lines.append('<ul>')
-                    in_list = True
-                formatted_lines.append(f'<li>{line.strip()[2:].strip()}</li>')
-            else:
-                if in_list:
-                    formatted_lines.append('</ul>')
-                    in_list = False
-                if line.strip(): # Only add non-empty lines as paragraphs
-                    formatted_lines.append(f'<p>{line.strip()}</p>')
-                else: # Preserve empty lines for spacing
-                    formatted_lines.append('<br>')
-        if in_list: # Close list if it was open at the end
-            formatted_lines.append('</ul>')
-        
-        analysis_html = '\n'.join(formatted_lines)
-        
-        html += f"<div>{analysis_html}</div>"
-        html += "<hr>"
-    html += "</body></html>"
-    return html
+        parts.append(_format_paper_header(i, paper))
+        parts.append("<h3>Analysis:</h3>\n<div>")
+        parts.append(paper.get('analysis_html') or render_markdown(paper['analysis']))
+        parts.append("</div><hr>\n")
+    parts.append("</body></html>")
+    return ''.join(parts)
+
+def _format_paper_header(i, paper):
+    """Returns the escaped title, link, authors and summary block of one paper."""
+    parts = []
+    title = escape(paper['title'])
+    pdf_url = escape(paper['pdf_url'])
+    is_single_pdf = paper.get('relevance_score') == 'N/A'
+    if is_single_pdf:
+        parts.append(f"<h2>{title}</h2>\n")
+        display_path = escape(paper['pdf_url'].replace('file://', ''))
+        parts.append(f"<p><strong>File Path:</strong> <a href=\"{pdf_url}\">{display_path}</a></p>\n")
+    else:
+        parts.append(f"<h2>{i+1}. <a href=\"{pdf_url}\">{title}</a> "
+                     f"(Relevance Score: {escape(str(paper.get('relevance_score', 'N/A')))})</h2>\n")
+
+    if paper.get('authors') and paper.get('authors') != ['N/A']:
+        parts.append(f"<p><strong>Authors:</strong> {escape(', '.join(paper['authors']))}</p>\n")
+
+    if not is_single_pdf:
+        parts.append(f"<h3>Summary:</h3>\n<p>{escape(paper['summary'])}</p>\n")
+    return ''.join(parts)
 
 if __name__ == '__main__':
     # Example usage
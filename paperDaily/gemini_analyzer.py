@@ -1,85 +1,276 @@
-from google import genai
-from config import GEMINI_API_KEY, ARXIV_QUERY, ARXIV_CATEGORIES
-import os
-from dotenv import load_dotenv
+from config import (
+    ARXIV_QUERY, ARXIV_CATEGORIES, SCORING_BATCH_SIZE, SCORING_MAX_RETRIES, MODEL_NAME, ANALYSIS_STREAM_MAX_RESUMES,
+    ANALYSIS_PROMPT_TOKEN_BUDGET, MAP_REDUCE_MIN_TOKENS, MAP_REDUCE_CHUNK_TOKENS, MAP_REDUCE_MAX_PARALLEL, MAP_REDUCE_MAP_MODEL, MAP_REDUCE_REDUCE_MODEL,
+    ANALYSIS_BATCH_POLL_SECONDS
+)
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from prompt_builder import build_prompt, estimate_tokens, split_into_chunks
+from gemini_client import (
+    GeminiCallError, is_configured, generate_content, generate_content_stream, submit_batch, get_batch, cancel_batch
+)
+from paper_store import (
+    load_analysis_stream, start_analysis_stream, append_analysis_chunk, finish_analysis_stream,
+    get_analysis_batch, save_analysis_batch, finish_analysis_batch
+)
 
-load_dotenv()
+# All calls go through gemini_client, which shares one client, rate-limits and retries.
 
-# The new SDK doesn't require a global configure call.
-# The API key will be passed during client initialization or read from env.
-
-def _get_search_criteria_string():
+def _get_search_criteria_string(profile=None):
+    query = ARXIV_QUERY if profile is None else profile.get('query')
+    categories = ARXIV_CATEGORIES if profile is None else profile.get('categories')
     criteria = []
-    if ARXIV_QUERY:
-        criteria.append(f"关键词: {ARXIV_QUERY}")
-    if ARXIV_CATEGORIES:
-        criteria.append(f"分类: {', '.join(ARXIV_CATEGORIES)}")
+    if query:
+        criteria.append(f"关键词: {query}")
+    if categories:
+        criteria.append(f"分类: {', '.join(categories)}")
     return "; ".join(criteria) if criteria else "无特定搜索条件"
 
+def get_scoring_cache_key(profile=None):
+    """
+    Returns (criteria_hash, model_name) identifying the scoring setup of `profile`
+    (or of the global search settings). Cached relevance scores are only reused
+    while both stay the same.
+    """
+    criteria_hash = hashlib.sha256(_get_search_criteria_string(profile).encode('utf-8')).hexdigest()
+    return criteria_hash, MODEL_NAME
+
 def score_paper_relevance(title, summary):
     """
     Uses the Gemini API to score a paper's relevance based on its title and summary
     against the predefined search criteria.
-    Returns a score between 0 and 100.
+    Returns a score between 0 and 100, or None if scoring failed.
     """
-    if not GEMINI_API_KEY or GEMINI_API_KEY == "YOUR_GEMINI_API_KEY":
-        return 0 # Cannot score without API key
+    return score_papers_relevance_batch([(title, summary)])[0]
 
-    try:
-        model_name = os.getenv("MODEL_NAME", "gemini-2.5-flash")
-        client = genai.Client(api_key=GEMINI_API_KEY)
-        search_criteria_str = _get_search_criteria_string()
+# Structured-output schema for batch scoring: one {id, score} object per paper.
+_BATCH_SCORE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "id": {"type": "INTEGER"},
+            "score": {"type": "INTEGER"},
+        },
+        "required": ["id", "score"],
+    },
+}
 
-        prompt = f"""
-        你是一个专业的AI研究助手。请根据以下搜索条件，评估一篇论文的相关性，并给出一个0到100分的相关性分数。100分表示高度相关，0分表示完全不相关。
+def _build_papers_block(papers):
+    """The variable part of a scoring request: [(paper_id, (title, summary))] as ID-tagged blocks."""
+    return "\n\n".join(
+        f"[论文ID: {paper_id}]\n论文标题: {title}\n论文摘要: {summary}" for paper_id, (title, summary) in papers
+    )
 
-        搜索条件: {search_criteria_str}
+def _build_batch_scoring_instructions(search_criteria_str):
+    # Fixed for a whole run, so it is sent as a (cacheable) prefix ahead of each batch of papers.
+    return f"""
+        你是一个专业的AI研究助手。请根据以下搜索条件，分别评估用户给出的每一篇论文的相关性，并为每篇论文给出一个0到100分的相关性分数。100分表示高度相关，0分表示完全不相关。
 
-        论文标题: {title}
-        论文摘要: {summary}
+        搜索条件: {search_criteria_str}
 
-        请直接输出一个整数分数，不要包含任何其他文字或解释。
+        请输出一个JSON数组，每篇论文对应一个元素，格式为 {{"id": 论文ID, "score": 整数分数}}，必须覆盖用户列出的全部论文ID，不要包含任何其他文字或解释。
         """
-        
-        response = client.models.generate_content_stream(
-            model=model_name,
-            contents=prompt
-        )
 
-        full_response = []
-        for chunk in response:
-            full_response.append(chunk.text)
-        
-        score_str = "".join(full_response).strip()
-        try:
-            return int(score_str)
-        except ValueError:
-            print(f"Warning: Gemini returned non-integer score: {score_str}. Defaulting to 0.")
-            return 0
+def _parse_batch_scores(response_text, expected_ids):
+    """
+    Parses a batch scoring reply and returns {paper_id: score} for every well-formed
+    entry whose ID was requested. Unknown, duplicate or out-of-range entries are dropped.
+    """
+    try:
+        entries = json.loads(response_text)
+    except (TypeError, ValueError):
+        print(f"Warning: Gemini returned malformed batch scores: {response_text!r}")
+        return {}
+    if not isinstance(entries, list):
+        print(f"Warning: Gemini returned non-list batch scores: {response_text!r}")
+        return {}
 
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        print(f"An error occurred during Gemini API call for scoring: {e}")
-        return 0
+    scores = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        paper_id, score = entry.get("id"), entry.get("score")
+        if isinstance(paper_id, bool) or isinstance(score, bool):
+            continue
+        if not isinstance(paper_id, int) or not isinstance(score, int):
+            continue
+        if paper_id not in expected_ids or paper_id in scores or not 0 <= score <= 100:
+            continue
+        scores[paper_id] = score
+    return scores
 
-def analyze_paper_content(content):
+def _score_in_batches(papers, instructions, schema, parse_reply, batch_size, max_retries):
     """
-    Uses the Gemini API to analyze a paper's full content.
+    Shared batching/retry loop of the scoring functions. Every request sends the fixed
+    `instructions` as prefix and a batch of papers as contents; `parse_reply(text, expected_ids)`
+    returns {paper_id: result}. Returns a list of results, None for papers never scored.
+    """
+    from google.genai import types
+    results = [None] * len(papers)
+    batch_size = max(1, batch_size)
+    pending = list(range(len(papers)))
+    for attempt in range(max_retries + 1):
+        if not pending:
+            break
+        if attempt:
+            print(f"Retrying relevance scoring for {len(pending)} paper(s) missing from previous replies (attempt {attempt + 1}).")
+        missing = []
+        for start in range(0, len(pending), batch_size):
+            batch_ids = pending[start:start + batch_size]
+            prompt = _build_papers_block([(paper_id, papers[paper_id]) for paper_id in batch_ids])
+            try:
+                response = generate_content(
+                    prompt,
+                    config=types.GenerateContentConfig(
+                        response_mime_type="application/json",
+                        response_schema=schema,
+                    ),
+                    prefix=instructions,
+                )
+                batch_results = parse_reply(response.text, set(batch_ids))
+            except GeminiCallError as e:
+                print(f"An error occurred during Gemini API call for batch scoring: {e}")
+                batch_results = {}
+
+            for paper_id in batch_ids:
+                if paper_id in batch_results:
+                    results[paper_id] = batch_results[paper_id]
+                else:
+                    missing.append(paper_id)
+        pending = missing
+
+    if pending:
+        print(f"Warning: Could not score {len(pending)} paper(s) after {max_retries + 1} attempt(s); marking them as scoring failed.")
+    return results
+
+def score_papers_relevance_batch(papers, batch_size=SCORING_BATCH_SIZE, max_retries=SCORING_MAX_RETRIES, profile=None):
+    """
+    Scores many papers against the search criteria of `profile` (default: the global
+    search settings) with one structured-output Gemini request per batch of `batch_size` papers.
+    `papers` is a sequence of (title, summary) pairs; returns a list of scores (0-100)
+    in the same order. Papers missing from a reply are retried up to `max_retries` times;
+    papers that still cannot be scored get None (scoring failed), which is distinct
+    from a genuine score of 0.
     """
-    if not GEMINI_API_KEY or GEMINI_API_KEY == "YOUR_GEMINI_API_KEY":
-        return {
-            "highlights": "Gemini API key not configured. Please add it to your .env file.",
-            "concrete_work": "No analysis performed."
-        }
+    papers = list(papers)
+    if not papers:
+        return []
+    if not is_configured():
+        print("Gemini API key not configured; relevance scoring skipped.")
+        return [None] * len(papers) # Cannot score without API key
+
+    search_criteria_str = _get_search_criteria_string(profile)
+    return _score_in_batches(
+        papers,
+        _build_batch_scoring_instructions(search_criteria_str),
+        _BATCH_SCORE_SCHEMA,
+        _parse_batch_scores,
+        batch_size,
+        max_retries,
+    )
+
+def _profile_labels(profiles):
+    # Short labels keep the schema valid whatever the profile names contain.
+    return [f"P{i + 1}" for i in range(len(profiles))]
 
+def _build_profile_scores_schema(labels):
+    return {
+        "type": "ARRAY",
+        "items": {
+            "type": "OBJECT",
+            "properties": {
+                "id": {"type": "INTEGER"},
+                "scores": {
+                    "type": "OBJECT",
+                    "properties": {label: {"type": "INTEGER"} for label in labels},
+                    "required": labels,
+                },
+            },
+            "required": ["id", "scores"],
+        },
+    }
+
+def _build_profile_scoring_instructions(criteria_by_label):
+    criteria_str = "\n".join(f"[画像 {label}] {criteria}" for label, criteria in criteria_by_label.items())
+    example = ", ".join(f'"{label}": 整数分数' for label in criteria_by_label)
+    return f"""
+        你是一个专业的AI研究助手。下面列出了若干个订阅画像，每个画像有各自的搜索条件。请分别评估用户给出的每一篇论文与每个画像的相关性，并给出0到100分的相关性分数。100分表示高度相关，0分表示完全不相关。
+
+        {criteria_str}
+
+        请输出一个JSON数组，每篇论文对应一个元素，格式为 {{"id": 论文ID, "scores": {{{example}}}}}，必须覆盖用户列出的全部论文ID和全部画像，不要包含任何其他文字或解释。
+        """
+
+def _parse_profile_scores(response_text, expected_ids, labels):
+    """
+    Parses a multi-profile scoring reply and returns {paper_id: {label: score}} for
+    entries that score every profile. Incomplete or malformed entries are dropped.
+    """
     try:
-        model_name = os.getenv("MODEL_NAME", "gemini-2.5-flash")
-        client = genai.Client(api_key=GEMINI_API_KEY)
-        prompt = f"""
-        作为一名专业的人工智能大模型AI研究员，请根据提供的论文全文，以严谨、专业的视角，用中文进行深入分析，并**直接输出以下结构化的总结内容，不要包含任何额外的介绍性文字或开场白。**
+        entries = json.loads(response_text)
+    except (TypeError, ValueError):
+        print(f"Warning: Gemini returned malformed batch scores: {response_text!r}")
+        return {}
+    if not isinstance(entries, list):
+        print(f"Warning: Gemini returned non-list batch scores: {response_text!r}")
+        return {}
+
+    results = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        paper_id, scores = entry.get("id"), entry.get("scores")
+        if isinstance(paper_id, bool) or not isinstance(paper_id, int) or not isinstance(scores, dict):
+            continue
+        if paper_id not in expected_ids or paper_id in results:
+            continue
+        values = [scores.get(label) for label in labels]
+        if all(isinstance(v, int) and not isinstance(v, bool) and 0 <= v <= 100 for v in values):
+            results[paper_id] = dict(zip(labels, values))
+    return results
 
-        论文全文: "{content}"
+def score_papers_for_profiles(papers, profiles, batch_size=SCORING_BATCH_SIZE, max_retries=SCORING_MAX_RETRIES):
+    """
+    Scores (title, summary) pairs against every profile in one pass: each batch request
+    asks for all profile scores of its papers at once. Returns, per paper, a
+    {profile_name: score} dict, or None if the paper could not be scored.
+    """
+    papers = list(papers)
+    if len(profiles) == 1:
+        name = profiles[0]['name']
+        return [
+            None if score is None else {name: score}
+            for score in score_papers_relevance_batch(papers, batch_size, max_retries, profile=profiles[0])
+        ]
+    if not papers:
+        return []
+    if not is_configured():
+        print("Gemini API key not configured; relevance scoring skipped.")
+        return [None] * len(papers)
+
+    labels = _profile_labels(profiles)
+    criteria_by_label = {label: _get_search_criteria_string(profile) for label, profile in zip(labels, profiles)}
+    names_by_label = {label: profile['name'] for label, profile in zip(labels, profiles)}
+    results = _score_in_batches(
+        papers,
+        _build_profile_scoring_instructions(criteria_by_label),
+        _build_profile_scores_schema(labels),
+        lambda text, expected_ids: _parse_profile_scores(text, expected_ids, labels),
+        batch_size,
+        max_retries,
+    )
+    return [
+        None if scores is None else {names_by_label[label]: score for label, score in scores.items()}
+        for scores in results
+    ]
+
+# Instructions for the full-text analysis. They are the same for every paper, so they are sent as
+# a (cacheable) prefix; the (budgeted) paper text follows as _ANALYSIS_BODY_TEMPLATE.
+_ANALYSIS_INSTRUCTIONS = """
+        作为一名专业的人工智能大模型AI研究员，请根据用户提供的论文全文，以严谨、专业的视角，用中文进行深入分析，并**直接输出以下结构化的总结内容，不要包含任何额外的介绍性文字或开场白。**
 
         请按照以下结构进行分析和总结：
 
@@ -121,21 +312,312 @@ def analyze_paper_content(content):
 
         请确保你的回答内容翔实、逻辑清晰、重点突出，并严格遵循上述结构进行输出。
         """
-        
-        response = client.models.generate_content_stream(
-            model=model_name,
-            contents=prompt
-        )
 
+_ANALYSIS_BODY_TEMPLATE = '论文全文: "{content}"'
+
+# Map step of long papers: one chunk of the paper text in, a dense Chinese summary out.
+_CHUNK_SUMMARY_INSTRUCTIONS = """
+        你是一名专业的人工智能研究员。用户会给出一篇长论文的一个片段及其包含的章节。请用中文对该片段做详尽的要点总结，供之后撰写整篇论文的分析报告使用。**直接输出总结内容，不要包含任何额外的说明。**
+
+        要求：
+        *   保留所有关键数字、公式含义、模型与方法名称、数据集、评估指标和实验结论，专有名词保留原文。
+        *   如果片段中出现论文标题、作者、作者邮箱、机构、公司或学校信息，请原样列出。
+        *   不要推测片段之外的内容。
+        """
+_CHUNK_SUMMARY_BODY_TEMPLATE = '第 {index}/{total} 个片段（包含章节: {sections}）\n论文片段: "{content}"'
+
+# Reduce step of long papers: the full-text analysis instructions applied to the chunk summaries.
+_REDUCE_INSTRUCTIONS = _ANALYSIS_INSTRUCTIONS.replace(
+    "根据用户提供的论文全文", "根据用户提供的论文各片段的要点总结（按原文顺序排列，覆盖整篇论文）"
+)
+_REDUCE_BODY_TEMPLATE = '论文各片段总结: "{content}"'
+
+# Sent after a stream broke midway: the original request (without the instructions prefix) plus what was already generated.
+_CONTINUATION_PROMPT_TEMPLATE = """{prompt}
+
+        你之前的回答在输出过程中被中断了。以下是已经输出的部分：
+        <已输出>
+        {partial}
+        </已输出>
+        请从中断处继续输出剩余内容，不要重复已输出的部分，也不要添加任何说明。
+        """
+
+# Appended to an analysis whose stream could not be completed.
+PARTIAL_ANALYSIS_NOTE = "\n\n*（分析输出在生成过程中中断，以上为部分结果。）*\n"
+
+def _prompt_hash(prompt, model=MODEL_NAME, instructions=''):
+    return hashlib.sha256(f"{model}\n{instructions}\n{prompt}".encode('utf-8')).hexdigest()[:16]
+
+def _build_request(instructions, body_template, content):
+    """
+    Returns (body, stats): `content` fitted into `body_template` so that instructions and body
+    together stay within ANALYSIS_PROMPT_TOKEN_BUDGET. stats['prompt_tokens'] counts both.
+    """
+    instruction_tokens = estimate_tokens(instructions)
+    body, stats = build_prompt(body_template, content, ANALYSIS_PROMPT_TOKEN_BUDGET - instruction_tokens)
+    stats['prompt_tokens'] += instruction_tokens
+    return body, stats
+
+def _summarize_chunk(chunks, index, stream_key):
+    """
+    Map step for one chunk: returns its summary (None if the call failed) and the estimated
+    prompt tokens. With a `stream_key` the summary is saved, so a resumed analysis reuses
+    it and the reduce prompt comes out identical.
+    """
+    sections, text = chunks[index]
+    prompt = _CHUNK_SUMMARY_BODY_TEMPLATE.format(
+        index=index + 1, total=len(chunks), sections=", ".join(sections), content=text
+    )
+    prompt_tokens = estimate_tokens(_CHUNK_SUMMARY_INSTRUCTIONS) + estimate_tokens(prompt)
+    key = f"{stream_key}#map{index}" if stream_key else None
+    prompt_hash = _prompt_hash(prompt, MAP_REDUCE_MAP_MODEL, _CHUNK_SUMMARY_INSTRUCTIONS)
+    saved = load_analysis_stream(key, prompt_hash) if key else None
+    if saved and saved['status'] == 'complete' and saved['text']:
+        return saved['text'], 0
+    try:
+        summary = generate_content(prompt, model=MAP_REDUCE_MAP_MODEL, prefix=_CHUNK_SUMMARY_INSTRUCTIONS).text
+    except GeminiCallError as e:
+        print(f"  Summary of chunk {index + 1}/{len(chunks)} failed: {e}")
+        return None, prompt_tokens
+    if summary and key:
+        start_analysis_stream(key, prompt_hash)
+        append_analysis_chunk(key, summary)
+        finish_analysis_stream(key, 'complete')
+    return summary or None, prompt_tokens
+
+def _build_map_reduce_prompt(content, stats, stream_key):
+    """
+    Map step of a long paper: splits `content` into section-aligned chunks of about
+    MAP_REDUCE_CHUNK_TOKENS, summarises them in parallel with MAP_REDUCE_MAP_MODEL and
+    returns the reduce request body built from the summaries (see _build_request). Chunks
+    whose summary failed are left out with a note; raises GeminiCallError if every chunk failed.
+    """
+    chunks = split_into_chunks(content, MAP_REDUCE_CHUNK_TOKENS)
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, MAP_REDUCE_MAX_PARALLEL), thread_name_prefix='map') as executor:
+        results = list(executor.map(lambda index: _summarize_chunk(chunks, index, stream_key), range(len(chunks))))
+    stats['map_s'] = round(time.perf_counter() - started_at, 4)
+    stats['map_chunks'] = len(chunks)
+    stats['map_prompt_tokens'] = sum(tokens for _, tokens in results)
+    stats['map_peak_prompt_tokens'] = max(tokens for _, tokens in results)
+
+    failed = [i + 1 for i, (summary, _) in enumerate(results) if summary is None]
+    if len(failed) == len(chunks):
+        raise GeminiCallError(f"all {len(chunks)} chunk summaries failed")
+    blocks = []
+    for i, ((sections, _), (summary, _)) in enumerate(zip(chunks, results)):
+        if summary is None:
+            blocks.append(f"[片段 {i + 1}/{len(chunks)}: {', '.join(sections)}]\n（该片段总结失败，内容缺失。）")
+        else:
+            blocks.append(f"[片段 {i + 1}/{len(chunks)}: {', '.join(sections)}]\n{summary.strip()}")
+    print(f"  Summarised {len(chunks) - len(failed)}/{len(chunks)} chunk(s) with {MAP_REDUCE_MAP_MODEL} in {stats['map_s']:.2f}s"
+          + (f" (failed: {failed})" if failed else ""))
+    prompt, prompt_stats = _build_request(_REDUCE_INSTRUCTIONS, _REDUCE_BODY_TEMPLATE, "\n\n".join(blocks))
+    prompt_stats['original_tokens'] = estimate_tokens(content)
+    return prompt, prompt_stats
+
+def needs_map_reduce(content):
+    """True if `content` is long enough (MAP_REDUCE_MIN_TOKENS) to be analyzed by map-reduce."""
+    return bool(MAP_REDUCE_MIN_TOKENS) and estimate_tokens(content) > MAP_REDUCE_MIN_TOKENS
+
+def stream_paper_analysis(content, stats=None, stream_key=None):
+    """
+    Generator over the text chunks of a paper analysis, yielded as Gemini streams them.
+    Papers longer than MAP_REDUCE_MIN_TOKENS are map-reduced: chunk summaries first
+    (see _build_map_reduce_prompt), then the report is streamed from them with
+    MAP_REDUCE_REDUCE_MODEL. Shorter papers go into a single prompt.
+    With a `stream_key` (e.g. the arXiv ID) every chunk is also appended to the state
+    store, so an interrupted analysis is replayed from there and continued rather than
+    regenerated. A stream that breaks midway is continued up to ANALYSIS_STREAM_MAX_RESUMES
+    times; after that the partial text is kept and PARTIAL_ANALYSIS_NOTE is yielded last.
+    `stats` receives the prompt token estimates, the API usage, 'ttft_s' (seconds to the
+    first generated chunk), 'partial' and, for map-reduced papers, 'map_chunks',
+    'map_prompt_tokens', 'map_peak_prompt_tokens' and 'map_s'.
+    Raises GeminiCallError if nothing was generated.
+    """
+    stats = stats if stats is not None else {}
+    if needs_map_reduce(content):
+        model, instructions = MAP_REDUCE_REDUCE_MODEL, _REDUCE_INSTRUCTIONS
+        prompt, prompt_stats = _build_map_reduce_prompt(content, stats, stream_key)
+    else:
+        model, instructions = MODEL_NAME, _ANALYSIS_INSTRUCTIONS
+        prompt, prompt_stats = _build_request(_ANALYSIS_INSTRUCTIONS, _ANALYSIS_BODY_TEMPLATE, content)
+    if prompt_stats['dropped_sections'] or prompt_stats['compressed_sections']:
+        print(f"  Prompt trimmed from ~{prompt_stats['original_tokens']} to ~{prompt_stats['content_tokens']} content tokens "
+              f"(dropped: {prompt_stats['dropped_sections']}, compressed: {prompt_stats['compressed_sections']})")
+    stats.update(prompt_stats)
+    stats['partial'] = False
+
+    prompt_hash = _prompt_hash(prompt, model, instructions)
+    saved = load_analysis_stream(stream_key, prompt_hash) if stream_key else None
+    generated = [saved['text']] if saved and saved['text'] else []
+    if saved and generated:
+        stats['ttft_s'] = saved['ttft_s']
+        yield saved['text']
+        if saved['status'] == 'complete':
+            return
+        print(f"  Resuming analysis of {stream_key} after {len(saved['text'])} saved characters.")
+    elif stream_key:
+        start_analysis_stream(stream_key, prompt_hash)
+
+    resumes = 0
+    while True:
+        request = prompt if not generated else _CONTINUATION_PROMPT_TEMPLATE.format(prompt=prompt, partial=''.join(generated))
+        started_at = time.perf_counter()
+        try:
+            for chunk in generate_content_stream(request, model=model, prefix=instructions):
+                text = chunk.text
+                if text:
+                    ttft_s = None
+                    if 'ttft_s' not in stats or stats['ttft_s'] is None:
+                        ttft_s = stats['ttft_s'] = round(time.perf_counter() - started_at, 4)
+                    generated.append(text)
+                    if stream_key:
+                        append_analysis_chunk(stream_key, text, ttft_s)
+                    yield text
+                usage = getattr(chunk, 'usage_metadata', None)
+                if usage is not None:
+                    stats['usage_prompt_tokens'] = usage.prompt_token_count
+                    stats['usage_response_tokens'] = usage.candidates_token_count
+                    stats['usage_cached_tokens'] = getattr(usage, 'cached_content_token_count', None) or 0
+            break
+        except GeminiCallError as e:
+            if not generated:
+                raise
+            if resumes < ANALYSIS_STREAM_MAX_RESUMES:
+                resumes += 1
+                print(f"  Analysis stream broke ({e}); continuing from {len(''.join(generated))} characters "
+                      f"(resume {resumes}/{ANALYSIS_STREAM_MAX_RESUMES}).")
+                continue
+            print(f"  Analysis stream broke again ({e}); keeping the partial analysis.")
+            stats['partial'] = True
+            break
+
+    if stream_key:
+        finish_analysis_stream(stream_key, 'partial' if stats['partial'] else 'complete')
+    if stats['partial']:
+        yield PARTIAL_ANALYSIS_NOTE
+
+# Batch jobs ending in any of these states will not produce (more) results.
+_BATCH_DONE_STATES = {
+    'JOB_STATE_SUCCEEDED', 'JOB_STATE_PARTIALLY_SUCCEEDED', 'JOB_STATE_FAILED', 'JOB_STATE_CANCELLED', 'JOB_STATE_EXPIRED'
+}
+_BATCH_MAX_AGE_SECONDS = 48 * 3600 # Gemini drops batch jobs after 48 hours
+
+def _batch_state(job):
+    return getattr(job.state, 'name', job.state)
+
+def analyze_papers_deferred(items, deadline):
+    """
+    Analyzes `items` ([(stream_key, content)]) with one Gemini batch job instead of one
+    streaming call each, waiting until the job is done or the unix time `deadline`.
+    Results go into the state store like finished streams, so resubmitting the same items
+    (e.g. after a crash) reuses finished analyses, and a job still running for the same
+    requests is polled again rather than submitted twice.
+    Returns {stream_key: (analysis, stats)} for the analyses collected. Items left out -
+    papers long enough for map-reduce, failed requests and anything unfinished at the
+    deadline (the job is then cancelled) - are for the caller to analyze interactively.
+    """
+    results, pending = {}, []
+    for stream_key, content in items:
+        if needs_map_reduce(content):
+            continue
+        prompt, stats = _build_request(_ANALYSIS_INSTRUCTIONS, _ANALYSIS_BODY_TEMPLATE, content)
+        prompt_hash = _prompt_hash(prompt, MODEL_NAME, _ANALYSIS_INSTRUCTIONS)
+        saved = load_analysis_stream(stream_key, prompt_hash)
+        if saved and saved['status'] == 'complete' and saved['text']:
+            results[stream_key] = (saved['text'], {**stats, 'partial': False, 'batch': True})
+        else:
+            pending.append((stream_key, prompt_hash, prompt, stats))
+    if not pending or not is_configured():
+        return results
+
+    batch_key = hashlib.sha256(
+        "\n".join(f"{stream_key} {prompt_hash}" for stream_key, prompt_hash, _, _ in pending).encode('utf-8')
+    ).hexdigest()[:16]
+    job_name = get_analysis_batch(batch_key, _BATCH_MAX_AGE_SECONDS)
+    try:
+        if job_name is None:
+            if time.time() >= deadline:
+                print(f"  The batch deadline has passed; analyzing {len(pending)} papers interactively.")
+                return results
+            # The instructions go inline: a job can outlive this run's context caches
+            # (their TTL, and release_context_caches() at the end of the job).
+            from google.genai import types
+            config = types.GenerateContentConfig(system_instruction=_ANALYSIS_INSTRUCTIONS)
+            job_name = submit_batch(
+                [{'contents': [{'role': 'user', 'parts': [{'text': prompt}]}], 'config': config} for _, _, prompt, _ in pending],
+                display_name=f"paperdaily-{batch_key}",
+            )
+            save_analysis_batch(batch_key, job_name)
+            print(f"  Submitted {len(pending)} analyses as batch job {job_name}.")
+        else:
+            print(f"  Collecting batch job {job_name} submitted earlier for these {len(pending)} analyses.")
+
+        job = get_batch(job_name)
+        while _batch_state(job) not in _BATCH_DONE_STATES and time.time() < deadline:
+            time.sleep(max(0.0, min(ANALYSIS_BATCH_POLL_SECONDS, deadline - time.time())))
+            job = get_batch(job_name)
+    except GeminiCallError as e:
+        print(f"  Batch analysis failed ({e}); analyzing interactively instead.")
+        return results
+
+    state = _batch_state(job)
+    if state not in _BATCH_DONE_STATES:
+        print(f"  Batch job {job_name} is still {state} at the deadline; cancelling it and analyzing interactively.")
+        try:
+            cancel_batch(job_name)
+        except GeminiCallError as e:
+            print(f"  Could not cancel batch job {job_name}: {e}")
+        finish_analysis_batch(batch_key)
+        return results
+
+    responses = (job.dest.inlined_responses if job.dest is not None else None) or []
+    for (stream_key, prompt_hash, _, stats), response in zip(pending, responses):
+        reply = response.response if response.error is None else None
+        text = reply.text if reply is not None else None
+        if not text:
+            continue
+        usage = getattr(reply, 'usage_metadata', None)
+        if usage is not None:
+            stats['usage_prompt_tokens'] = usage.prompt_token_count
+            stats['usage_response_tokens'] = usage.candidates_token_count
+            stats['usage_cached_tokens'] = getattr(usage, 'cached_content_token_count', None) or 0
+        stats.update(partial=False, batch=True)
+        start_analysis_stream(stream_key, prompt_hash)
+        append_analysis_chunk(stream_key, text)
+        finish_analysis_stream(stream_key, 'complete')
+        results[stream_key] = (text, stats)
+    finish_analysis_batch(batch_key)
+    collected = sum(1 for stream_key, _, _, _ in pending if stream_key in results)
+    print(f"  Batch job {job_name} {state}: collected {collected}/{len(pending)} analyses.")
+    return results
+
+def analyze_paper_content(content, stats=None, stream_key=None, on_chunk=None):
+    """
+    Uses the Gemini API to analyze a paper's full content.
+    The content is fitted to ANALYSIS_PROMPT_TOKEN_BUDGET by dropping or compressing
+    low-value sections. If a `stats` dict is given, it is filled with the estimated
+    token counts (see prompt_builder.build_prompt) and, when the API reports it,
+    the actual 'usage_prompt_tokens' / 'usage_response_tokens', plus 'ttft_s' and 'partial'.
+    The response is streamed (see stream_paper_analysis); `on_chunk` is called with
+    each text chunk as it arrives, e.g. to feed a MarkdownRenderer.
+    Returns None if the analysis failed.
+    """
+    if not is_configured():
+        print("Gemini API key not configured. Please add it to your .env file.")
+        return None
+
+    try:
         full_response = []
-        for chunk in response:
-            if chunk.text:
-                full_response.append(chunk.text)
+        for text in stream_paper_analysis(content, stats=stats, stream_key=stream_key):
+            full_response.append(text)
+            if on_chunk is not None:
+                on_chunk(text)
         return "".join(full_response)
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return f"An error occurred during Gemini API call: {e}"
+    except GeminiCallError as e:
+        print(f"An error occurred during Gemini API call: {e}")
+        return None
 
 if __name__ == '__main__':
     test_content = "We introduce a new large language model called 'SuperModel' that outperforms GPT-4 on all benchmarks. We trained it on a dataset of 10 trillion tokens and used a novel attention mechanism."
@@ -0,0 +1,239 @@
+import hashlib
+import random
+import threading
+import time
+from config import (
+    GEMINI_API_KEY, MODEL_NAME, GEMINI_REQUESTS_PER_MINUTE, GEMINI_TOKENS_PER_MINUTE,
+    GEMINI_MAX_RETRIES, GEMINI_RETRY_BASE_DELAY, GEMINI_RETRY_MAX_DELAY,
+    CONTEXT_CACHE_ENABLED, CONTEXT_CACHE_MIN_TOKENS, CONTEXT_CACHE_TTL_MINUTES
+)
+from prompt_builder import estimate_tokens
+import metrics
+
+# google.genai and httpx are imported where they are first needed: importing the SDK takes
+# most of a second, which commands that never call Gemini should not pay.
+
+# HTTP status codes worth retrying: rate limiting and transient server errors.
+_RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+_client = None
+_client_lock = threading.Lock()
+
+_context_caches = {} # (model, prefix hash) -> (cached content name or None, monotonic expiry)
+_context_cache_lock = threading.Lock()
+
+
+class GeminiCallError(Exception):
+    """Raised when a Gemini call fails permanently or keeps failing after all retries."""
+
+class _TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `rate_per_minute`, holding
+    at most one minute's worth of tokens. A rate of 0 or None disables limiting.
+    """
+
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute or 0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        if not self.capacity:
+            return
+        amount = min(float(amount), self.capacity) # Oversized requests wait for a full bucket
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.capacity / 60.0)
+                self.updated_at = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) * 60.0 / self.capacity
+            time.sleep(wait)
+
+_request_bucket = _TokenBucket(GEMINI_REQUESTS_PER_MINUTE)
+_token_bucket = _TokenBucket(GEMINI_TOKENS_PER_MINUTE)
+
+
+def is_configured():
+    """Returns True if a Gemini API key is configured."""
+    return bool(GEMINI_API_KEY) and GEMINI_API_KEY != "YOUR_GEMINI_API_KEY"
+
+def get_client():
+    """Returns the process-wide Gemini client, creating it on first use so connections are reused."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if not is_configured():
+                    raise GeminiCallError("Gemini API key not configured. Please add it to your .env file.")
+                from google import genai
+                _client = genai.Client(api_key=GEMINI_API_KEY)
+    return _client
+
+def _is_retryable(error):
+    import httpx
+    from google.genai import errors
+    if isinstance(error, errors.APIError):
+        return error.code in _RETRYABLE_STATUS_CODES
+    return isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError))
+
+def _backoff_delay(attempt):
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(GEMINI_RETRY_MAX_DELAY, GEMINI_RETRY_BASE_DELAY * (2 ** attempt)))
+
+def _throttle(contents):
+    _request_bucket.acquire(1)
+    _token_bucket.acquire(estimate_tokens(contents) if isinstance(contents, str) else 1)
+
+def _call_with_retries(description, call):
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        try:
+            return call()
+        except Exception as e:
+            if not _is_retryable(e):
+                raise GeminiCallError(f"{description} failed: {e}") from e
+            if attempt == GEMINI_MAX_RETRIES:
+                raise GeminiCallError(f"{description} failed after {attempt + 1} attempts: {e}") from e
+            delay = _backoff_delay(attempt)
+            metrics.increment('gemini_retries')
+            print(f"  Gemini {description} failed ({e}); retrying in {delay:.1f}s (attempt {attempt + 2}/{GEMINI_MAX_RETRIES + 1}).")
+            time.sleep(delay)
+
+def _context_cache_name(prefix, model):
+    """
+    Returns the name of a cached content holding `prefix` as system instruction for `model`,
+    creating it on first use. None if caching is off, the prefix is below CONTEXT_CACHE_MIN_TOKENS
+    or the cache could not be created (the failure is remembered until the TTL would have run out).
+    """
+    if not CONTEXT_CACHE_ENABLED or estimate_tokens(prefix) < CONTEXT_CACHE_MIN_TOKENS:
+        return None
+    key = (model, hashlib.sha256(prefix.encode('utf-8')).hexdigest())
+    ttl_seconds = CONTEXT_CACHE_TTL_MINUTES * 60
+    # Held while creating, so concurrent callers wait for one cache instead of each creating their own.
+    with _context_cache_lock:
+        entry = _context_caches.get(key)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+        from google.genai import types
+        try:
+            cache = _call_with_retries("caches.create", lambda: get_client().caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=prefix, ttl=f"{ttl_seconds}s", display_name="paperdaily-prompt-prefix"
+                ),
+            ))
+            name = cache.name
+            metrics.increment('context_caches_created')
+            print(f"  Cached a ~{estimate_tokens(prefix)} token prompt prefix for {model} as {name}.")
+        except GeminiCallError as e:
+            name = None
+            print(f"  Context caching unavailable for {model} ({e}); sending the prompt prefix inline.")
+        # Refresh a minute early so no request references a cache that is about to expire.
+        _context_caches[key] = (name, time.monotonic() + max(ttl_seconds - 60, 60))
+        return name
+
+def prefix_config(prefix, model=None, config=None):
+    """
+    Returns a GenerateContentConfig (a copy of `config`, if given) that carries the fixed
+    instructions `prefix`: by reference to a context cache when one applies, else as the
+    system instruction. Requests then only send their variable part as contents.
+    """
+    from google.genai import types
+    model = model or MODEL_NAME
+    cache_name = _context_cache_name(prefix, model)
+    update = {'cached_content': cache_name} if cache_name else {'system_instruction': prefix}
+    if config is None:
+        return types.GenerateContentConfig(**update)
+    return config.model_copy(update=update)
+
+def release_context_caches():
+    """Deletes the context caches created by this process (they would otherwise live until their TTL)."""
+    with _context_cache_lock:
+        names = [name for name, _ in _context_caches.values() if name]
+        _context_caches.clear()
+    for name in names:
+        try:
+            _call_with_retries("caches.delete", lambda name=name: get_client().caches.delete(name=name))
+        except GeminiCallError as e:
+            print(f"Warning: Could not delete context cache {name}: {e}")
+
+def _record_usage(usage):
+    # Prompt tokens served from a context cache (explicit or implicit) are billed at a discount.
+    cached_tokens = getattr(usage, 'cached_content_token_count', None) if usage is not None else None
+    if cached_tokens:
+        metrics.increment('cached_prompt_tokens', cached_tokens)
+
+def generate_content(contents, model=None, config=None, prefix=None):
+    """
+    Calls models.generate_content on the shared client under the request/token
+    rate limits, retrying rate-limit and transient errors with backoff. A `prefix`
+    of fixed instructions is sent through prefix_config (context cache or system instruction).
+    Raises GeminiCallError on failure.
+    """
+    if prefix is not None:
+        config = prefix_config(prefix, model, config)
+
+    def call():
+        _throttle(contents)
+        metrics.increment('gemini_calls')
+        return get_client().models.generate_content(model=model or MODEL_NAME, contents=contents, config=config)
+
+    response = _call_with_retries("generate_content", call)
+    _record_usage(getattr(response, 'usage_metadata', None))
+    return response
+
+def generate_content_stream(contents, model=None, config=None, prefix=None):
+    """
+    Streaming counterpart of generate_content: yields response chunks. Errors before
+    the first chunk are retried; a stream that breaks midway raises GeminiCallError.
+    """
+    if prefix is not None:
+        config = prefix_config(prefix, model, config)
+
+    def start():
+        _throttle(contents)
+        metrics.increment('gemini_calls')
+        started_at = time.perf_counter()
+        stream = iter(get_client().models.generate_content_stream(
+            model=model or MODEL_NAME, contents=contents, config=config
+        ))
+        # Pull the first chunk here so connection and quota errors are retried.
+        first_chunk = next(stream, None)
+        metrics.observe('gemini_first_chunk', time.perf_counter() - started_at)
+        return stream, first_chunk
+
+    stream, first_chunk = _call_with_retries("generate_content_stream", start)
+    if first_chunk is None:
+        return
+    usage = getattr(first_chunk, 'usage_metadata', None)
+    yield first_chunk
+    try:
+        for chunk in stream:
+            usage = getattr(chunk, 'usage_metadata', None) or usage # The last chunk carries the totals
+            yield chunk
+    except Exception as e:
+        raise GeminiCallError(f"generate_content_stream broke mid-response: {e}") from e
+    _record_usage(usage)
+
+def submit_batch(requests, model=None, display_name=None):
+    """
+    Submits `requests` (inline {'contents', 'config'} requests) as one batch job and returns
+    its name. Batch jobs are billed at a discount and run outside the interactive rate limits.
+    """
+    def call():
+        metrics.increment('gemini_batch_jobs')
+        return get_client().batches.create(
+            model=model or MODEL_NAME, src=requests, config={'display_name': display_name} if display_name else None
+        )
+    return _call_with_retries("batches.create", call).name
+
+def get_batch(name):
+    """Returns the current state of batch job `name`."""
+    return _call_with_retries("batches.get", lambda: get_client().batches.get(name=name))
+
+def cancel_batch(name):
+    """Cancels batch job `name`."""
+    _call_with_retries("batches.cancel", lambda: get_client().batches.cancel(name=name))
@@ -1,117 +1,255 @@
-import schedule
-import time
 from datetime import datetime
-from arxiv_fetcher import fetch_latest_papers, _download_and_extract_text
-from gemini_analyzer import analyze_paper_content
-from email_sender import send_email, format_papers_to_html
-from config import MAX_NEW_PAPERS_TO_ANALYZE
+from pdf_cache import cache_key_for_file, cache_key_for_url, get_cached_text, put_cached_text
+from paper_store import (
+    get_pdf_analyses, save_pdf_analysis, load_analyzed_papers, save_analyzed_paper, start_job_run, finish_job_run, record_checkpoints,
+    load_checkpoints, prune_job_runs, adopt_legacy_deliveries, get_known_paper_ids, queue_deliveries,
+    get_undelivered_papers, get_waiting_profiles, prune_outbox, prune_analysis_streams, get_received_paper_ids,
+    set_delivery_status
+)
+from config import RECEIVER_EMAIL, PROFILES, CHECKPOINT_RESUME_HOURS, CHECKPOINT_RETENTION_DAYS, EMAIL_ASYNC, DEDUP_ENABLED
+import metrics
+import glob
 import os
-from dotenv import load_dotenv
-from tqdm import tqdm
 
-load_dotenv()
-ANALYZED_PAPERS_FILE = os.getenv("ANALYZED_PAPERS_FILE", "analyzed_papers.txt")
+# The fetch, pipeline, Gemini and email modules are imported inside the functions that use
+# them: --help, --pdf on a local file and the scheduler process then skip the arXiv client,
+# numpy, tqdm and SMTP/TLS imports they never need (see benchmark.py --import-time).
 
 
 def _load_analyzed_papers_info():
-    """Loads the info (ID, title, relevance score) of already analyzed papers."""
-    analyzed_info = {}
-    if os.path.exists(ANALYZED_PAPERS_FILE):
-        with open(ANALYZED_PAPERS_FILE, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line:
-                    parts = line.split(',', 2)  # Split into at most 3 parts
-                    if len(parts) == 3:
-                        arxiv_id, title, relevance_score_str = parts
-                        try:
-                            relevance_score = int(relevance_score_str)
-                        except ValueError:
-                            relevance_score = 0  # Default if score is not a valid integer
-                        analyzed_info[arxiv_id] = (title, relevance_score)
-                    elif len(parts) == 2:  # Handle older format (ID, Title) without score
-                        arxiv_id, title = parts
-                        analyzed_info[arxiv_id] = (title, 0)  # Default score for older entries
-                    elif len(parts) == 1:  # Handle even older format (ID) without title or score
-                        arxiv_id = parts[0]
-                        analyzed_info[arxiv_id] = ('Unknown Title', 0)
-    return analyzed_info
-def _save_analyzed_paper_info(arxiv_id, title, relevance_score):
-    """
-    Saves a new arXiv ID, title, and relevance score to the list of analyzed papers.
-    """
-    with open(ANALYZED_PAPERS_FILE, 'a') as f:
-        f.write(f"{arxiv_id},{title},{relevance_score}\n")
+    """
+    Returns a mapping of already analyzed papers (ID -> (title, relevance score)).
+    Lookups hit the paper store's primary-key index; nothing is parsed up front.
+    """
+    return load_analyzed_papers()
+
+def _save_analyzed_paper_info(arxiv_id, title, relevance_score, analysis=None, prompt_stats=None, analysis_html=None):
+    """
+    Saves a new arXiv ID, title, relevance score, analysis (and its rendered HTML) and prompt token usage to the paper store.
+    """
+    prompt_stats = prompt_stats or {}
+    save_analyzed_paper(
+        arxiv_id, title, relevance_score, analysis,
+        prompt_tokens=prompt_stats.get('usage_prompt_tokens', prompt_stats.get('prompt_tokens')),
+        original_tokens=prompt_stats.get('original_tokens'),
+        analysis_html=analysis_html
+    )
+
+def _print_run_summary(summary):
+    stage_times = ", ".join(f"{name} {stats['total_s']:.2f}s/{stats['calls']}" for name, stats in summary['stages'].items())
+    print(f"Run metrics ({summary['status']}, {summary['wall_s']:.2f}s): {stage_times or 'no stages'}")
+    if summary['counters']:
+        print("  " + ", ".join(f"{name}={value}" for name, value in summary['counters'].items()))
 
 def job():
+    """Runs the daily digest once, recording per-stage timings and counters for the run."""
+    from gemini_client import release_context_caches
+    metrics.start_run('job')
+    status = 'error'
+    try:
+        _run_job()
+        status = 'ok'
+    finally:
+        release_context_caches()
+        _print_run_summary(metrics.finish_run(status))
+
+def _run_job():
+    from email_sender import deliver_outbox, OutboxSender
     print(f"Running job at {datetime.now()}...")
+    prune_job_runs(CHECKPOINT_RETENTION_DAYS * 86400)
+    prune_outbox(CHECKPOINT_RETENTION_DAYS * 86400)
+    prune_analysis_streams(CHECKPOINT_RETENTION_DAYS * 86400)
+    # Runs are resumed per set of profiles: a crashed run of one schedule is not picked up by another's.
+    run_id, resumed = start_job_run(
+        CHECKPOINT_RESUME_HOURS * 3600, scope=",".join(sorted(profile['name'] for profile in PROFILES))
+    )
+    adopt_legacy_deliveries([profile['name'] for profile in PROFILES])
     analyzed_papers_info = _load_analyzed_papers_info()
-    existing_analyzed_paper_ids = set(analyzed_papers_info.keys())
-    print(f"Loaded {len(existing_analyzed_paper_ids)} previously analyzed paper IDs.")
+    print(f"Loaded {len(analyzed_papers_info)} previously analyzed paper IDs.")
+
+    queued_digests = {} # digest_id -> papers, to checkpoint them once delivered
+
+    def on_digest_done(email, status):
+        if status == 'sent' and email['digest_id'] in queued_digests:
+            record_checkpoints(run_id, queued_digests.pop(email['digest_id']), 'emailed')
+
+    # In async mode digests (including ones left over from earlier runs) go out while analysis runs.
+    outbox_sender = OutboxSender(on_digest_done).start() if EMAIL_ASYNC else None
+    try:
+        if outbox_sender is not None:
+            outbox_sender.notify()
+        _analyze_and_queue_digests(run_id, resumed, analyzed_papers_info, queued_digests, outbox_sender)
+    finally:
+        if outbox_sender is not None:
+            with metrics.stage('send_email'):
+                outbox_sender.close()
+    if outbox_sender is None:
+        with metrics.stage('send_email'):
+            deliver_outbox(on_digest_done=on_digest_done)
+    finish_job_run(run_id)
+    print("Job finished.")
+
+def _analyze_and_queue_digests(run_id, resumed, analyzed_papers_info, queued_digests, outbox_sender=None):
+    """
+    Selects this run's papers (after the unfinished ones of a resumed run), analyzes them
+    and queues each profile's digest in the outbox. With `outbox_sender`, a profile's digest is queued as soon as all of
+    its papers from this run are analyzed.
+    """
+    from pipeline import run_analysis_pipeline
+    checkpoints = load_checkpoints(run_id) if resumed else []
+    selected = [(status, paper) for status, paper in checkpoints if status in ('selected', 'downloaded')]
+    resumed_papers = []
+    if selected or any(status in ('analyzed', 'emailed') for status, _ in checkpoints):
+        # The previous attempt of this run got past selection: pick up the unfinished papers,
+        # then fetch as usual so a stale selection never replaces today's papers.
+        resumed_papers = [
+            paper for _, paper in selected if paper['arxiv_id'] not in analyzed_papers_info or paper.get('revised')
+        ]
+        print(f"Resuming run {run_id}: {len(resumed_papers)} selected papers still to analyze.")
+    elif resumed:
+        print(f"Resuming run {run_id} from the fetch step.")
+    resumed_ids = {paper['arxiv_id'] for paper in resumed_papers}
+    new_papers_to_analyze = resumed_papers + [
+        paper for paper in _fetch_and_select_papers(run_id, analyzed_papers_info) if paper['arxiv_id'] not in resumed_ids
+    ]
+
+    profiles_by_name = {profile['name']: profile for profile in PROFILES}
+    waiting = {} # profile name -> papers of this run it still waits for
+    if outbox_sender is not None:
+        for arxiv_id, names in get_waiting_profiles([paper['arxiv_id'] for paper in new_papers_to_analyze]).items():
+            for name in names:
+                waiting.setdefault(name, set()).add(arxiv_id)
 
+    # 2. Download PDFs and Analyze papers
+    if new_papers_to_analyze:
+        print("Downloading PDFs and analyzing papers with Gemini (this may take a while)...")
+
+        def on_analyzed(paper):
+            _save_analyzed_paper_info(
+                paper['arxiv_id'], paper['title'], paper['relevance_score'], paper['analysis'], paper['prompt_stats'],
+                paper.get('analysis_html')
+            )
+            record_checkpoints(run_id, [paper], 'analyzed')
+            if DEDUP_ENABLED:
+                from dedup import index_paper
+                index_paper(paper)
+            for name, arxiv_ids in waiting.items():
+                if paper['arxiv_id'] in arxiv_ids:
+                    arxiv_ids.discard(paper['arxiv_id'])
+                    if not arxiv_ids and name in profiles_by_name:
+                        _queue_profile_digest(profiles_by_name[name], queued_digests)
+                        outbox_sender.notify()
+
+        with metrics.stage('analysis_pipeline', papers=len(new_papers_to_analyze)):
+            analyzed_papers = run_analysis_pipeline(
+                new_papers_to_analyze,
+                on_analyzed=on_analyzed,
+                on_downloaded=lambda paper: record_checkpoints(run_id, [paper], 'downloaded')
+            )
+        if analyzed_papers:
+            print(f"Successfully analyzed {len(analyzed_papers)} new papers.")
+        else:
+            print("No new papers were analyzed in this run.")
+
+    # 3. Queue each profile's digest of everything analyzed but not yet delivered (including earlier runs)
+    for profile in PROFILES:
+        if not _queue_profile_digest(profile, queued_digests):
+            print(f"No analyzed papers waiting to be emailed to profile '{profile['name']}'.")
+
+def _fetch_and_select_papers(run_id, analyzed_papers_info):
+    """
+    Fetches and scores the latest papers once for all profiles, checkpoints them, queues
+    each profile's top new papers for its digest and returns the ones still to analyze.
+    """
+    from arxiv_fetcher import fetch_latest_papers
     # 1. Fetch paper metadata and score relevance
     print("Fetching latest paper metadata from arXiv and scoring relevance...")
-    papers_metadata = fetch_latest_papers(analyzed_papers_info)
+    with metrics.stage('fetch_and_score'):
+        papers_metadata = fetch_latest_papers(analyzed_papers_info)
     if not papers_metadata:
         print("No new papers found.")
-        return
+        return []
 
     print(f"Found {len(papers_metadata)} papers from arXiv (metadata only).")
-
-    # Filter out already analyzed papers and select top N new papers
-    new_papers_to_consider = []
+    record_checkpoints(run_id, [paper for paper in papers_metadata if paper['relevance_score'] is None], 'fetched')
+    record_checkpoints(run_id, [paper for paper in papers_metadata if paper['relevance_score'] is not None], 'scored')
     for paper in papers_metadata:
-        if paper['arxiv_id'] not in existing_analyzed_paper_ids:
-            new_papers_to_consider.append(paper)
-        else:
-            print(f"  Skipping already analyzed paper: '{paper['title']}' (ID: {paper['arxiv_id']})")
+        if paper['relevance_score'] is None:
+            print(f"  Skipping paper whose relevance scoring failed: '{paper['title']}' (ID: {paper['arxiv_id']})")
 
-    if not new_papers_to_consider:
-        print("No new papers to analyze after filtering.")
-        return
-
-    # Select top N new papers based on relevance (already sorted by fetch_latest_papers)
-    new_papers_to_analyze = new_papers_to_consider[:MAX_NEW_PAPERS_TO_ANALYZE]
-    print(f"Selected {len(new_papers_to_analyze)} top new papers for detailed analysis.")
+    # Select each profile's top N new papers; a paper picked by several profiles is analyzed once.
+    selected_ids = set()
+    for profile in PROFILES:
+        name = profile['name']
+        # Revised papers changed since they were delivered, so every profile may pick them again.
+        known_ids = get_known_paper_ids(name, [paper['arxiv_id'] for paper in papers_metadata if not paper.get('revised')])
+        candidates = [
+            paper for paper in papers_metadata
+            if paper['profile_scores'].get(name) is not None and paper['profile_scores'][name] >= profile['min_score']
+            and paper['arxiv_id'] not in known_ids
+        ]
+        candidates.sort(key=lambda paper: (paper['profile_scores'][name], paper['published']), reverse=True)
+        chosen = candidates[:profile['max_papers']]
+        queue_deliveries(name, chosen)
+        selected_ids.update(paper['arxiv_id'] for paper in chosen)
+        print(f"  Profile '{name}': selected {len(chosen)} of {len(candidates)} new matching papers.")
 
-    # 2. Download PDFs and Analyze papers
-    print("Downloading PDFs and analyzing papers with Gemini (this may take a while)...")
-    analyzed_papers = []
-    for i, paper in enumerate(tqdm(new_papers_to_analyze, desc="Analyzing papers")):
-        print(f"  ({i + 1}/{len(new_papers_to_analyze)}) Downloading PDF for '{paper['title']}'")
-        content = _download_and_extract_text(paper['pdf_url'])
-        if content:
-            print(f"  ({i + 1}/{len(new_papers_to_analyze)}) Analyzing '{paper['title']}' (ID: {paper['arxiv_id']})")
-            analysis = analyze_paper_content(content)
-            analyzed_papers.append({
-                **paper,
-                'content': content, # Add content for completeness if needed later
-                'analysis': analysis
-            })
-            _save_analyzed_paper_info(paper['arxiv_id'], paper['title'], paper['relevance_score'])
-        else:
-            print(f"  Skipping analysis for '{paper['title']}' due to PDF download failure.")
-    if analyzed_papers:
-        print(f"Successfully analyzed {len(analyzed_papers)} new papers.")
-    else:
-        print("No new papers were analyzed in this run.")
-        return
+    selected = [paper for paper in papers_metadata if paper['arxiv_id'] in selected_ids]
+    record_checkpoints(run_id, selected, 'selected')
+    new_papers_to_analyze = [
+        paper for paper in selected if paper['arxiv_id'] not in analyzed_papers_info or paper.get('revised')
+    ]
+    if not new_papers_to_analyze:
+        print("No new papers to analyze after filtering.")
+        return []
+    print(f"Selected {len(new_papers_to_analyze)} top new papers for detailed analysis "
+          f"({len(selected) - len(new_papers_to_analyze)} more reuse earlier analyses).")
+    return new_papers_to_analyze
 
-    # 3. Format and send email
-    print("Formatting email...")
-    subject = f"Daily arXiv Digest: Top {len(analyzed_papers)} New Papers - {datetime.now().strftime('%Y-%m-%d')}"
-    html_content = format_papers_to_html(analyzed_papers, subject)
+def _queue_profile_digest(profile, queued_digests):
+    """
+    Formats `profile`'s digest of its undelivered papers and adds it to the outbox. Recipients
+    who already got some of them (from a digest that reached only part of its recipients)
+    get a digest without those. Returns False if there was nothing to send.
+    """
+    from email_sender import format_papers_to_html, queue_digest
+    papers = get_undelivered_papers(profile['name'])
+    if not papers:
+        return False
+    recipients = profile['recipients'] or RECEIVER_EMAIL
+    received = get_received_paper_ids(profile['name'], recipients, [paper['arxiv_id'] for paper in papers])
+    groups = {} # arxiv_ids still owed -> recipients owed exactly those
+    for recipient in recipients:
+        owed = tuple(paper['arxiv_id'] for paper in papers if paper['arxiv_id'] not in received[recipient])
+        if owed:
+            groups.setdefault(owed, []).append(recipient)
+    if not recipients:
+        groups[tuple(paper['arxiv_id'] for paper in papers)] = recipients
+    if not groups:
+        set_delivery_status(profile['name'], [paper['arxiv_id'] for paper in papers], 'sent')
+        return False
+    for owed, group_recipients in groups.items():
+        group_papers = [paper for paper in papers if paper['arxiv_id'] in owed]
+        print(f"Formatting email for profile '{profile['name']}' ({len(group_papers)} papers)...")
+        subject = f"Daily arXiv Digest: Top {len(group_papers)} New Papers - {datetime.now().strftime('%Y-%m-%d')}"
+        if len(PROFILES) > 1:
+            subject = f"[{profile['name']}] {subject}"
+        with metrics.stage('format_html', papers=len(group_papers)):
+            html_content = format_papers_to_html(group_papers, subject)
+        digest_id = queue_digest(profile['name'], subject, html_content, group_recipients, list(owed))
+        queued_digests[digest_id] = group_papers
+    return True
 
-    print("Sending email...")
-    send_email(subject, html_content)
-    print("Job finished.")
 def analyze_pdf(pdf_path_or_url):
     """
     Analyzes a single PDF from a local path or URL.
     """
+    from gemini_analyzer import analyze_paper_content
+    from email_sender import send_email, format_papers_to_html
     print(f"Analyzing PDF from: {pdf_path_or_url}")
 
     if pdf_path_or_url.startswith('http'):
+        from arxiv_fetcher import _download_and_extract_text
         content = _download_and_extract_text(pdf_path_or_url)
         title = pdf_path_or_url.split('/')[-1] # Use filename as title
         source_url = pdf_path_or_url
@@ -119,14 +257,16 @@ def analyze_pdf(pdf_path_or_url):
         if not os.path.exists(pdf_path_or_url):
             print(f"Error: File not found at {pdf_path_or_url}")
             return
-        # To re-use _download_and_extract_text, we need to read the file in binary mode
-        # and pass the content to fitz.open. Let's create a helper for local files.
-        import fitz # PyMuPDF
         try:
-            with fitz.open(pdf_path_or_url) as doc:
-                content = ""
-                for page in doc:
-                    content += page.get_text()
+            cache_key = cache_key_for_file(pdf_path_or_url)
+            content = get_cached_text(cache_key)
+            if content is None:
+                from pdf_extractor import extract_pdf_text
+                content, stats = extract_pdf_text(pdf_path_or_url)
+                if content:
+                    print(f"Extracted {stats['pages']} pages / {stats['chars']} chars, peak RSS {stats['peak_rss_mb']} MB")
+                    if not stats['truncated']:
+                        put_cached_text(cache_key, content)
             title = os.path.basename(pdf_path_or_url)
             source_url = f"file://{os.path.abspath(pdf_path_or_url)}"
         except Exception as e:
@@ -139,6 +279,9 @@ def analyze_pdf(pdf_path_or_url):
 
     print(f"Analyzing content for '{title}'...")
     analysis = analyze_paper_content(content)
+    if analysis is None:
+        print("Analysis failed; no email sent.")
+        return
 
     analyzed_paper = {
         'title': title,
@@ -156,19 +299,117 @@ def analyze_pdf(pdf_path_or_url):
     print("Sending email...")
     send_email(subject, html_content)
     print("Analysis complete and email sent.")
+
+def is_pdf_batch(spec):
+    """True if `spec` names a directory, a glob pattern or a list file rather than one PDF."""
+    if spec.startswith(('http://', 'https://')):
+        return False
+    if os.path.isdir(spec) or glob.has_magic(spec):
+        return True
+    return os.path.isfile(spec) and not spec.lower().endswith('.pdf')
+
+def collect_pdf_sources(spec):
+    """
+    Expands a batch `spec` into PDF paths and URLs: every *.pdf in a directory, the matches
+    of a glob pattern (** allowed), or the lines of a list file (blank lines and # comments skipped).
+    """
+    if os.path.isdir(spec):
+        return sorted(
+            entry.path for entry in os.scandir(spec) if entry.is_file() and entry.name.lower().endswith('.pdf')
+        )
+    if glob.has_magic(spec):
+        return sorted(path for path in glob.glob(spec, recursive=True) if os.path.isfile(path))
+    with open(spec, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+def _pdf_batch_item(source):
+    """Returns the pipeline paper dict for one batch source, or None if a local file is missing."""
+    paper = {
+        'summary': 'Summary not available for local/URL PDF.',
+        'relevance_score': 'N/A',
+        'authors': ['N/A'],
+    }
+    if source.startswith(('http://', 'https://')):
+        paper.update(title=source.rstrip('/').split('/')[-1], pdf_url=source, cache_key=cache_key_for_url(source))
+        return paper
+    if not os.path.isfile(source):
+        print(f"  Skipping '{source}': file not found.")
+        return None
+    paper.update(
+        title=os.path.basename(source), pdf_url=f"file://{os.path.abspath(source)}", pdf_path=source,
+        cache_key=cache_key_for_file(source)
+    )
+    return paper
+
+def analyze_pdf_batch(sources):
+    """
+    Analyzes many local PDFs and/or URLs through the analysis pipeline (download threads,
+    extraction process pool, concurrent rate-limited Gemini calls) and queues one combined
+    digest. Every finished analysis is stored right away, so re-running the same batch
+    after an interruption only analyzes what is missing.
+    """
+    from gemini_client import release_context_caches
+    metrics.start_run('pdf_batch')
+    status = 'error'
+    try:
+        _run_pdf_batch(sources)
+        status = 'ok'
+    finally:
+        release_context_caches()
+        _print_run_summary(metrics.finish_run(status))
+
+def _run_pdf_batch(sources):
+    from pipeline import run_analysis_pipeline
+    from email_sender import format_papers_to_html, queue_digest, deliver_outbox
+    papers = [paper for paper in map(_pdf_batch_item, dict.fromkeys(sources)) if paper is not None]
+    papers = list({paper['cache_key']: paper for paper in papers}.values()) # Same file listed twice
+    if not papers:
+        print("No PDFs to analyze.")
+        return
+    done = get_pdf_analyses([paper['cache_key'] for paper in papers])
+    pending = [paper for paper in papers if paper['cache_key'] not in done]
+    print(f"Batch of {len(papers)} PDFs: {len(papers) - len(pending)} already analyzed, {len(pending)} to analyze.")
+
+    def on_analyzed(paper):
+        save_pdf_analysis(paper['cache_key'], paper['pdf_url'], paper['title'], paper['analysis'], paper.get('analysis_html'))
+
+    if pending:
+        run_analysis_pipeline(pending, on_analyzed=on_analyzed)
+        done = get_pdf_analyses([paper['cache_key'] for paper in papers])
+
+    analyzed = [
+        {**paper, 'analysis': done[paper['cache_key']]['analysis'], 'analysis_html': done[paper['cache_key']]['analysis_html']}
+        for paper in papers if paper['cache_key'] in done
+    ]
+    if len(analyzed) < len(papers):
+        print(f"{len(papers) - len(analyzed)} PDFs could not be analyzed; re-run the same batch to retry them.")
+    if not analyzed:
+        return
+    subject = f"Analysis of {len(analyzed)} Papers - {datetime.now().strftime('%Y-%m-%d')}"
+    with metrics.stage('format_html', papers=len(analyzed)):
+        html_content = format_papers_to_html(analyzed, subject)
+    queue_digest('pdf-batch', subject, html_content, None, [paper['cache_key'] for paper in analyzed])
+    with metrics.stage('send_email'):
+        sent, failed = deliver_outbox()
+    print(f"Batch digest queued; {sent} message(s) sent, {failed} failed.")
+
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description="Daily arXiv Paper Analyzer or specific PDF analyzer.")
-    parser.add_argument("--pdf", type=str, help="The local path or URL of a PDF to analyze.")
+    parser.add_argument("--pdf", type=str,
+                        help="The local path or URL of a PDF to analyze, or a directory, glob pattern or "
+                             "file listing PDF paths/URLs (one per line) to analyze as one batch.")
+    parser.add_argument("--once", action="store_true", help="Run the digest job once for all profiles and exit.")
     args = parser.parse_args()
-    if args.pdf:
+    if args.pdf and is_pdf_batch(args.pdf):
+        analyze_pdf_batch(collect_pdf_sources(args.pdf))
+    elif args.pdf:
         analyze_pdf(args.pdf)
+    elif args.once:
+        from scheduler import job_lock
+        with job_lock():
+            job()
     else:
-        # Schedule the job every day at a specific time, e.g., 8:00 AM
-        schedule.every().day.at("08:00").do(job)
-        print("Scheduler started. Waiting for the scheduled time...")
-        # Run once immediately for testing
-        job()
-        while True:
-            schedule.run_pending()
-            time.sleep(1)
+        # Each profile runs on its own cron schedule (default: daily at 08:00) in a worker process.
+        from scheduler import run_scheduler
+        run_scheduler()
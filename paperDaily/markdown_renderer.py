@@ -0,0 +1,145 @@
+import html
+import re
+
+# Number of an ordered list item, matched after the line's indentation.
+_NUMBER_RE = re.compile(r'(\d{1,9})[.)][ \t]+')
+_BULLETS = frozenset('-*+')
+_BLANKS = frozenset(' \t')
+# Every alternative starts with a literal character (boundary checks are lookbehinds after
+# it), so the regex engine skips plain text with its fast literal-prefix scan.
+# A closing ** must not be followed by another *, so `**b *i***` keeps its nested italic;
+# __bold__ must not touch word characters on the outside, so snake__case stays text.
+_INLINE_RE = re.compile(
+    r'`(?P<ticks>`*)(?P<code>.+?)`(?P=ticks)'
+    r'|\*\*(?!\*\*)(?P<bold>[^*\n]*(?:\*[^*\n]*)*?)\*\*(?!\*)'
+    r'|__(?<![\w_]__)(?P<bold_alt>[^\s_](?:.*?[^\s_])?)__(?![\w_])'
+    r'|\*(?<![*\w]\*)(?P<italic>[^\s*](?:.*?[^\s*])?)\*(?![*\w])'
+)
+_TAB_WIDTH = 4
+
+
+def _render_inline_match(match):
+    kind = match.lastgroup
+    text = match.group(kind)
+    if kind == 'code':
+        return f"<code>{text.strip()}</code>"
+    if kind == 'bold_alt' and text.isascii() and text.isidentifier():
+        return match.group() # A dunder name such as __init__, not emphasis
+    # Most bold/italic spans are plain text; skip the second scan for them.
+    if '*' in text or '`' in text or '_' in text:
+        text = _INLINE_RE.sub(_render_inline_match, text)
+    return f"<em>{text}</em>" if kind == 'italic' else f"<strong>{text}</strong>"
+
+def render_inline(text):
+    """
+    HTML-escapes `text` and renders inline Markdown (code spans, **bold**, __bold__,
+    *italic*) in one left-to-right regex scan. Spans never cross line breaks, so a
+    whole block of lines can be rendered in a single call.
+    """
+    return _INLINE_RE.sub(_render_inline_match, html.escape(text, quote=False))
+
+class MarkdownRenderer:
+    """
+    Incremental, single-pass Markdown to HTML renderer for Gemini analyses: headings,
+    paragraphs, nested bullet and numbered lists, code spans and emphasis.
+    Text can be fed in arbitrary chunks; each call returns the HTML for the lines
+    completed so far, and close() returns the rest.
+    """
+
+    def __init__(self):
+        self._pending = ''
+        self._lists = [] # Open lists, innermost last: (indent, tag)
+        self._blank_lines_in_list = 0 # Blank lines seen inside a list, emitted only if the list ends
+
+    def feed(self, text):
+        """Consumes a chunk of Markdown and returns the HTML of every completed line."""
+        text = self._pending + text
+        end = text.rfind('\n')
+        if end < 0:
+            self._pending = text
+            return ''
+        self._pending = text[end + 1:]
+        return self._render(text[:end])
+
+    def close(self):
+        """Renders the unfinished last line and closes any open lists."""
+        out = self._render(self._pending) if self._pending else ''
+        self._pending = ''
+        closing = []
+        self._close_lists(-1, closing)
+        return out + ''.join(block + '\n' for block in closing)
+
+    def _close_lists(self, indent, out):
+        # Closes every open list nested deeper than `indent`.
+        lists = self._lists
+        while lists and lists[-1][0] > indent:
+            out.append(f"</li></{lists.pop()[1]}>")
+        if not lists and self._blank_lines_in_list:
+            out.append("<br>" * self._blank_lines_in_list)
+            self._blank_lines_in_list = 0
+
+    def _render(self, text):
+        # Escaping and inline markup never touch line starts, so they run once over the
+        # whole chunk; list markers are then recognised with string checks, since a regex
+        # scan per line costs more than the rest of the line handling.
+        out = []
+        append = out.append
+        lists = self._lists
+        top_level, top_tag = lists[-1] if lists else (-1, None) # Innermost open list
+        for line in render_inline(text).split('\n'):
+            content = line.lstrip(' \t')
+            indent = len(line) - len(content)
+            marker = content[:1]
+            tag = None
+            if marker in _BULLETS and content[1:2] in _BLANKS:
+                tag = 'ul'
+                content = content[2:].lstrip(' \t')
+            elif marker.isdigit():
+                match = _NUMBER_RE.match(content)
+                if match is not None:
+                    tag = 'ol'
+                    number = int(match.group(1))
+                    content = content[match.end():]
+            content = content.rstrip()
+            if tag is not None:
+                if self._blank_lines_in_list:
+                    self._blank_lines_in_list = 0
+                level = indent if '\t' not in line else len(line[:indent].expandtabs(_TAB_WIDTH))
+                if top_level > level or (top_level == level and top_tag != tag):
+                    # Close deeper lists, and a same-level list of the other type
+                    self._close_lists(level if top_level > level else level - 1, out)
+                    top_level, top_tag = lists[-1] if lists else (-1, None)
+                    if top_level == level and top_tag != tag:
+                        self._close_lists(level - 1, out)
+                        top_level, top_tag = lists[-1] if lists else (-1, None)
+                if top_level == level:
+                    append(f"</li>\n<li>{content}")
+                else:
+                    start = f'<ol start="{number}">' if tag == 'ol' and number != 1 else f"<{tag}>"
+                    append(f"{start}\n<li>{content}")
+                    lists.append((level, tag))
+                    top_level, top_tag = level, tag
+            elif not content:
+                if lists:
+                    self._blank_lines_in_list += 1 # Loose list: wait for the next line to decide
+                else:
+                    append("<br>") # Preserve empty lines for spacing
+            elif lists and indent:
+                self._blank_lines_in_list = 0
+                append(f"<br>{content}") # Indented continuation of the current item
+            else:
+                if lists:
+                    self._close_lists(-1, out)
+                    top_level, top_tag = -1, None
+                if content[0] == '#':
+                    title = content.lstrip('#')
+                    level = min(len(content) - len(title), 3) # For more than 3 hashes, default to h3
+                    append(f"<h{level}>{title.strip()}</h{level}>")
+                else:
+                    append(f"<p>{content}</p>")
+        return '\n'.join(out) + '\n' if out else '' # Newlines keep mail lines short
+
+def render_markdown(text):
+    """Renders a complete Markdown document to HTML."""
+    renderer = MarkdownRenderer()
+    return renderer.feed(text) + renderer.close()
@@ -0,0 +1,136 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from config import METRICS_LOG_FILE, METRICS_PROM_FILE
+
+_lock = threading.Lock()
+_run = None
+
+
+def _new_run(name):
+    return {
+        'run': name,
+        'started_at': time.time(),
+        'stages': {}, # name -> {'calls', 'total_s', 'max_s'}
+        'counters': {}, # name -> number
+    }
+
+def _current_run():
+    global _run
+    if _run is None:
+        _run = _new_run('adhoc')
+    return _run
+
+def _write_event(event):
+    if not METRICS_LOG_FILE:
+        return
+    try:
+        with open(METRICS_LOG_FILE, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"Warning: Could not write metrics to {METRICS_LOG_FILE}: {e}")
+
+def start_run(name='job'):
+    """Starts collecting metrics for a new run, discarding any previous totals."""
+    global _run
+    with _lock:
+        _run = _new_run(name)
+    _write_event({'event': 'run_start', 'run': name, 'time': datetime.now().isoformat()})
+
+def observe(stage_name, seconds):
+    """Adds one timed call of `stage_name` to the run totals (no log line is written)."""
+    with _lock:
+        stats = _current_run()['stages'].setdefault(stage_name, {'calls': 0, 'total_s': 0.0, 'max_s': 0.0})
+        stats['calls'] += 1
+        stats['total_s'] += seconds
+        stats['max_s'] = max(stats['max_s'], seconds)
+
+def increment(counter_name, amount=1):
+    """Adds `amount` to a run counter such as 'bytes_downloaded' or 'gemini_retries'."""
+    with _lock:
+        counters = _current_run()['counters']
+        counters[counter_name] = counters.get(counter_name, 0) + amount
+
+@contextmanager
+def stage(stage_name, **fields):
+    """
+    Times a block as one call of `stage_name` and writes a 'stage' event line with
+    its wall time, status and any extra `fields`.
+    """
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        observe(stage_name, elapsed)
+        _write_event({
+            'event': 'stage',
+            'run': _current_run()['run'],
+            'stage': stage_name,
+            'wall_s': round(elapsed, 4),
+            'status': status,
+            'time': datetime.now().isoformat(),
+            **fields,
+        })
+
+def _write_prometheus_textfile(summary):
+    """Atomically writes the run summary in the node_exporter textfile format."""
+    lines = [
+        "# HELP paperdaily_run_duration_seconds Wall time of the last run.",
+        "# TYPE paperdaily_run_duration_seconds gauge",
+        f"paperdaily_run_duration_seconds {summary['wall_s']}",
+        "# HELP paperdaily_run_success Whether the last run finished without error.",
+        "# TYPE paperdaily_run_success gauge",
+        f"paperdaily_run_success {1 if summary['status'] == 'ok' else 0}",
+        "# HELP paperdaily_last_run_timestamp_seconds Unix time the last run finished.",
+        "# TYPE paperdaily_last_run_timestamp_seconds gauge",
+        f"paperdaily_last_run_timestamp_seconds {int(time.time())}",
+        "# HELP paperdaily_stage_seconds Total wall time per stage in the last run.",
+        "# TYPE paperdaily_stage_seconds gauge",
+    ]
+    lines += [f'paperdaily_stage_seconds{{stage="{name}"}} {stats["total_s"]}' for name, stats in summary['stages'].items()]
+    lines += ["# HELP paperdaily_stage_calls Calls per stage in the last run.", "# TYPE paperdaily_stage_calls gauge"]
+    lines += [f'paperdaily_stage_calls{{stage="{name}"}} {stats["calls"]}' for name, stats in summary['stages'].items()]
+    for name, value in summary['counters'].items():
+        lines += [f"# TYPE paperdaily_{name} gauge", f"paperdaily_{name} {value}"]
+
+    directory = os.path.dirname(os.path.abspath(METRICS_PROM_FILE))
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, METRICS_PROM_FILE)
+    except OSError as e:
+        print(f"Warning: Could not write Prometheus metrics to {METRICS_PROM_FILE}: {e}")
+
+def finish_run(status='ok'):
+    """
+    Writes the run summary (per-stage totals and counters) to the JSON-lines log and,
+    if METRICS_PROM_FILE is set, to a Prometheus textfile. Returns the summary.
+    """
+    with _lock:
+        run = _current_run()
+        summary = {
+            'event': 'run_summary',
+            'run': run['run'],
+            'status': status,
+            'wall_s': round(time.time() - run['started_at'], 4),
+            'time': datetime.now().isoformat(),
+            'stages': {
+                name: {'calls': stats['calls'], 'total_s': round(stats['total_s'], 4), 'max_s': round(stats['max_s'], 4)}
+                for name, stats in run['stages'].items()
+            },
+            'counters': dict(run['counters']),
+        }
+    _write_event(summary)
+    if METRICS_PROM_FILE:
+        _write_prometheus_textfile(summary)
+    return summary
@@ -0,0 +1,816 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Mapping
+from datetime import datetime
+from config import PAPER_STORE_FILE, ANALYZED_PAPERS_FILE
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyzed_papers (
+    arxiv_id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    relevance_score INTEGER NOT NULL DEFAULT 0,
+    analysis TEXT,
+    analyzed_at TEXT,
+    email_status TEXT NOT NULL DEFAULT 'pending',
+    prompt_tokens INTEGER,
+    original_tokens INTEGER
+);
+CREATE TABLE IF NOT EXISTS relevance_scores (
+    arxiv_id TEXT NOT NULL,
+    criteria_hash TEXT NOT NULL,
+    model_name TEXT NOT NULL,
+    relevance_score INTEGER NOT NULL,
+    scored_at REAL NOT NULL,
+    PRIMARY KEY (arxiv_id, criteria_hash, model_name)
+);
+CREATE INDEX IF NOT EXISTS relevance_scores_scored_at ON relevance_scores (scored_at);
+CREATE TABLE IF NOT EXISTS profile_deliveries (
+    profile TEXT NOT NULL,
+    arxiv_id TEXT NOT NULL,
+    relevance_score INTEGER,
+    status TEXT NOT NULL DEFAULT 'pending',
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (profile, arxiv_id)
+);
+CREATE INDEX IF NOT EXISTS profile_deliveries_arxiv_id ON profile_deliveries (arxiv_id);
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    digest_id TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    html TEXT NOT NULL,
+    recipients TEXT NOT NULL,
+    arxiv_ids TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS email_outbox_status ON email_outbox (status);
+CREATE TABLE IF NOT EXISTS recipient_deliveries (
+    profile TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    arxiv_id TEXT NOT NULL,
+    sent_at REAL NOT NULL,
+    PRIMARY KEY (profile, arxiv_id, recipient)
+);
+CREATE TABLE IF NOT EXISTS job_runs (
+    run_id TEXT PRIMARY KEY,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    status TEXT NOT NULL DEFAULT 'running',
+    scope TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS job_checkpoints (
+    run_id TEXT NOT NULL,
+    arxiv_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    paper TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (run_id, arxiv_id)
+);
+CREATE INDEX IF NOT EXISTS job_checkpoints_arxiv_id ON job_checkpoints (arxiv_id);
+CREATE TABLE IF NOT EXISTS analysis_streams (
+    stream_key TEXT PRIMARY KEY,
+    prompt_hash TEXT NOT NULL,
+    text TEXT NOT NULL DEFAULT '', -- Only set by older versions, which appended chunks here
+    chunks INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'streaming',
+    ttft_s REAL,
+    started_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS analysis_stream_chunks (
+    stream_key TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (stream_key, seq)
+);
+CREATE TABLE IF NOT EXISTS pdf_analyses (
+    cache_key TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    title TEXT NOT NULL,
+    analysis TEXT NOT NULL,
+    analysis_html TEXT,
+    analyzed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dedup_signatures (
+    arxiv_id TEXT PRIMARY KEY,
+    signature BLOB NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dedup_buckets (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    arxiv_id TEXT NOT NULL,
+    PRIMARY KEY (band, bucket, arxiv_id)
+);
+CREATE INDEX IF NOT EXISTS dedup_buckets_arxiv_id ON dedup_buckets (arxiv_id);
+CREATE TABLE IF NOT EXISTS schedule_state (
+    profile TEXT PRIMARY KEY,
+    last_fire_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS analysis_batches (
+    batch_key TEXT PRIMARY KEY,
+    job_name TEXT NOT NULL,
+    submitted_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Per-paper checkpoint statuses of a job run, in the order they are reached
+CHECKPOINT_STATUSES = ('fetched', 'scored', 'selected', 'downloaded', 'analyzed', 'emailed')
+
+# Paper fields kept in a checkpoint; enough to resume analysis and render the digest
+_CHECKPOINT_FIELDS = (
+    'arxiv_id', 'title', 'summary', 'pdf_url', 'published', 'relevance_score', 'profile_scores', 'authors', 'revised'
+)
+
+# Tables keyed by arXiv ID whose old versioned IDs (2401.00001v1) are normalized once: table -> recency column
+_ARXIV_ID_TABLES = {
+    'analyzed_papers': 'analyzed_at',
+    'relevance_scores': 'scored_at',
+    'profile_deliveries': 'updated_at',
+    'job_checkpoints': 'updated_at',
+}
+_VERSION_SUFFIX_RE = re.compile(r'v\d+$')
+
+# Columns added after the first schema version: table -> {name: SQL type}
+_ADDED_COLUMNS = {
+    'analyzed_papers': {
+        'prompt_tokens': 'INTEGER',
+        'original_tokens': 'INTEGER',
+        'analysis_html': 'TEXT',
+    },
+    'job_runs': {
+        'scope': "TEXT NOT NULL DEFAULT ''",
+    },
+}
+
+# IDs bound per `IN (...)` lookup; older SQLite builds allow at most 999 parameters a statement
+_IN_CHUNK_SIZE = 500
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized_paths = set()
+
+
+def _connect():
+    """
+    Returns this thread's connection to the store, creating the schema and running
+    the legacy txt migration the first time the database file is opened.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and getattr(_local, 'path', None) == PAPER_STORE_FILE:
+        return conn
+    conn = sqlite3.connect(PAPER_STORE_FILE, timeout=30)
+    # WAL lets the pipeline's writer threads commit while readers keep going.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    _local.conn, _local.path = conn, PAPER_STORE_FILE
+    with _init_lock:
+        if PAPER_STORE_FILE not in _initialized_paths:
+            conn.executescript(_SCHEMA)
+            _add_missing_columns(conn)
+            _migrate_legacy_txt(conn)
+            _normalize_versioned_ids(conn)
+            _initialized_paths.add(PAPER_STORE_FILE)
+    return conn
+
+def _select_in(conn, sql, params, values):
+    """
+    Yields the rows of `sql`, whose trailing `IN ({})` is bound to `values` after `params`,
+    in one query per _IN_CHUNK_SIZE values instead of one per value.
+    """
+    values = list(dict.fromkeys(values))
+    for start in range(0, len(values), _IN_CHUNK_SIZE):
+        chunk = values[start:start + _IN_CHUNK_SIZE]
+        yield from conn.execute(sql.format(', '.join('?' * len(chunk))), (*params, *chunk))
+
+def _add_missing_columns(conn):
+    """Upgrades databases created by older versions with columns added since."""
+    with conn:
+        for table, columns in _ADDED_COLUMNS.items():
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            for name, sql_type in columns.items():
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {sql_type}")
+
+def _parse_legacy_line(line):
+    """
+    Parses one line of the old analyzed_papers.txt formats:
+    "ID,Title,Score", "ID,Title" or "ID". Returns (arxiv_id, title, score) or None.
+    """
+    line = line.strip()
+    if not line:
+        return None
+    # The score is the last field, so split from the right to survive commas in titles.
+    parts = line.split(',')
+    if len(parts) >= 3:
+        try:
+            return parts[0], ','.join(parts[1:-1]), int(parts[-1])
+        except ValueError:
+            return parts[0], ','.join(parts[1:]), 0 # Default if score is not a valid integer
+    if len(parts) == 2: # Older format (ID, Title) without score
+        return parts[0], parts[1], 0
+    return parts[0], 'Unknown Title', 0 # Even older format (ID) without title or score
+
+def _migrate_legacy_txt(conn):
+    """One-shot import of ANALYZED_PAPERS_FILE into the store."""
+    if conn.execute("SELECT 1 FROM store_meta WHERE key = 'legacy_txt_migrated'").fetchone():
+        return
+    rows = []
+    if os.path.exists(ANALYZED_PAPERS_FILE):
+        with open(ANALYZED_PAPERS_FILE, 'r', encoding='utf-8') as f:
+            for line in f:
+                parsed = _parse_legacy_line(line)
+                if parsed:
+                    rows.append(parsed)
+    with conn:
+        # Papers in the old file were already delivered by the run that analyzed them.
+        conn.executemany(
+            "INSERT OR IGNORE INTO analyzed_papers (arxiv_id, title, relevance_score, email_status) "
+            "VALUES (?, ?, ?, 'sent')",
+            rows
+        )
+        conn.execute("INSERT INTO store_meta (key, value) VALUES ('legacy_txt_migrated', ?)", (datetime.now().isoformat(),))
+    if rows:
+        print(f"Migrated {len(rows)} analyzed papers from {ANALYZED_PAPERS_FILE} to {PAPER_STORE_FILE}.")
+
+def normalize_arxiv_id(arxiv_id):
+    """Strips the version suffix: '2401.00001v2' -> '2401.00001', 'hep-th/9901001v1' -> 'hep-th/9901001'."""
+    return _VERSION_SUFFIX_RE.sub('', arxiv_id)
+
+def _normalize_versioned_ids(conn):
+    """
+    One-shot rewrite of versioned arXiv IDs stored by older versions to their base ID.
+    Rows are rewritten oldest first, so when several versions of a paper exist the most
+    recent row wins.
+    """
+    if conn.execute("SELECT 1 FROM store_meta WHERE key = 'arxiv_ids_normalized'").fetchone():
+        return
+    renamed = 0
+    with conn:
+        for table, recency_column in _ARXIV_ID_TABLES.items():
+            rows = conn.execute(
+                f"SELECT rowid, arxiv_id FROM {table} WHERE arxiv_id GLOB '*v[0-9]*' ORDER BY {recency_column}"
+            ).fetchall()
+            for rowid, arxiv_id in rows:
+                base_id = normalize_arxiv_id(arxiv_id)
+                if base_id != arxiv_id:
+                    conn.execute(f"UPDATE OR REPLACE {table} SET arxiv_id = ? WHERE rowid = ?", (base_id, rowid))
+                    renamed += 1
+        conn.execute("INSERT INTO store_meta (key, value) VALUES ('arxiv_ids_normalized', ?)", (datetime.now().isoformat(),))
+    if renamed:
+        print(f"Normalized {renamed} versioned arXiv IDs in {PAPER_STORE_FILE}.")
+
+class AnalyzedPapersView(Mapping):
+    """
+    Read-only mapping of arxiv_id -> (title, relevance_score) backed by the store.
+    Membership checks and lookups are primary-key queries; nothing is loaded up front.
+    """
+
+    def __getitem__(self, arxiv_id):
+        row = _connect().execute(
+            "SELECT title, relevance_score FROM analyzed_papers WHERE arxiv_id = ?", (arxiv_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(arxiv_id)
+        return row[0], row[1]
+
+    def __contains__(self, arxiv_id):
+        return _connect().execute(
+            "SELECT 1 FROM analyzed_papers WHERE arxiv_id = ?", (arxiv_id,)
+        ).fetchone() is not None
+
+    def __iter__(self):
+        for (arxiv_id,) in _connect().execute("SELECT arxiv_id FROM analyzed_papers"):
+            yield arxiv_id
+
+    def __len__(self):
+        return _connect().execute("SELECT COUNT(*) FROM analyzed_papers").fetchone()[0]
+
+def load_analyzed_papers():
+    """Returns an AnalyzedPapersView over the store."""
+    _connect()
+    return AnalyzedPapersView()
+
+def save_analyzed_paper(arxiv_id, title, relevance_score, analysis=None, email_status='pending',
+                        prompt_tokens=None, original_tokens=None, analysis_html=None):
+    """
+    Inserts or updates an analyzed paper. `prompt_tokens` / `original_tokens` record the
+    analysis prompt size and the untrimmed paper size; `analysis_html` is the analysis
+    already rendered while it streamed in. Safe to call from concurrent threads.
+    """
+    conn = _connect()
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO analyzed_papers
+                (arxiv_id, title, relevance_score, analysis, analyzed_at, email_status, prompt_tokens, original_tokens,
+                 analysis_html)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(arxiv_id) DO UPDATE SET
+                title = excluded.title,
+                relevance_score = excluded.relevance_score,
+                analysis = COALESCE(excluded.analysis, analyzed_papers.analysis),
+                analyzed_at = excluded.analyzed_at,
+                email_status = excluded.email_status,
+                prompt_tokens = COALESCE(excluded.prompt_tokens, analyzed_papers.prompt_tokens),
+                original_tokens = COALESCE(excluded.original_tokens, analyzed_papers.original_tokens),
+                analysis_html = CASE WHEN excluded.analysis IS NULL THEN analyzed_papers.analysis_html
+                                     ELSE excluded.analysis_html END
+            """,
+            (arxiv_id, title, relevance_score, analysis, datetime.now().isoformat(), email_status,
+             prompt_tokens, original_tokens, analysis_html)
+        )
+
+def set_email_status(arxiv_ids, email_status):
+    """Records the email delivery status ('pending', 'sent' or 'failed') of papers."""
+    conn = _connect()
+    with conn:
+        conn.executemany(
+            "UPDATE analyzed_papers SET email_status = ? WHERE arxiv_id = ?",
+            [(email_status, arxiv_id) for arxiv_id in arxiv_ids]
+        )
+
+def get_cached_scores(arxiv_ids, criteria_hash, model_name, ttl_seconds=None):
+    """
+    Returns {arxiv_id: relevance_score} for the given papers already scored under
+    the same search criteria and model (and, if `ttl_seconds` is set, recently enough).
+    """
+    min_scored_at = time.time() - ttl_seconds if ttl_seconds else 0
+    return dict(_select_in(
+        _connect(),
+        "SELECT arxiv_id, relevance_score FROM relevance_scores "
+        "WHERE criteria_hash = ? AND model_name = ? AND scored_at >= ? AND arxiv_id IN ({})",
+        (criteria_hash, model_name, min_scored_at), arxiv_ids
+    ))
+
+def save_scores(scores, criteria_hash, model_name):
+    """Caches {arxiv_id: relevance_score} for the given search criteria and model."""
+    conn = _connect()
+    now = time.time()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO relevance_scores (arxiv_id, criteria_hash, model_name, relevance_score, scored_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(arxiv_id, criteria_hash, model_name, score, now) for arxiv_id, score in scores.items()]
+        )
+
+def evict_expired_scores(ttl_seconds):
+    """Deletes cached relevance scores older than `ttl_seconds`. Returns the number removed."""
+    conn = _connect()
+    with conn:
+        cursor = conn.execute("DELETE FROM relevance_scores WHERE scored_at < ?", (time.time() - ttl_seconds,))
+    return cursor.rowcount
+
+def start_job_run(resume_within_seconds=None, scope=''):
+    """
+    Returns (run_id, resumed). The most recent unfinished run of the same `scope` (e.g. the
+    names of the profiles it serves) is resumed if it started less than `resume_within_seconds`
+    ago; other unfinished runs of that scope, and of any scope once they are that old,
+    are marked 'abandoned'.
+    """
+    conn = _connect()
+    now = time.time()
+    with conn:
+        row = conn.execute(
+            "SELECT run_id, started_at FROM job_runs WHERE status = 'running' AND scope = ? "
+            "ORDER BY started_at DESC LIMIT 1",
+            (scope,)
+        ).fetchone()
+        if row is not None and (resume_within_seconds is None or now - row[1] < resume_within_seconds):
+            return row[0], True
+        conn.execute("UPDATE job_runs SET status = 'abandoned', finished_at = ? WHERE status = 'running' AND scope = ?",
+                     (now, scope))
+        if resume_within_seconds is not None:
+            conn.execute("UPDATE job_runs SET status = 'abandoned', finished_at = ? WHERE status = 'running' AND started_at < ?",
+                         (now, now - resume_within_seconds))
+        run_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        conn.execute("INSERT INTO job_runs (run_id, started_at, scope) VALUES (?, ?, ?)", (run_id, now, scope))
+    return run_id, False
+
+def finish_job_run(run_id, status='completed'):
+    """Marks a job run as finished so the next job starts a fresh one."""
+    conn = _connect()
+    with conn:
+        conn.execute("UPDATE job_runs SET status = ?, finished_at = ? WHERE run_id = ?", (status, time.time(), run_id))
+
+def _checkpoint_paper_json(paper):
+    return json.dumps({field: paper.get(field) for field in _CHECKPOINT_FIELDS}, ensure_ascii=False, default=str)
+
+def _load_checkpoint_paper(paper_json):
+    paper = json.loads(paper_json)
+    if isinstance(paper.get('published'), str):
+        try:
+            paper['published'] = datetime.fromisoformat(paper['published'])
+        except ValueError:
+            pass
+    return paper
+
+def record_checkpoints(run_id, papers, status):
+    """
+    Records that `papers` (paper dicts) reached `status` in this run. A paper's status
+    only moves forward, so late or repeated records never undo progress.
+    """
+    rank = CHECKPOINT_STATUSES.index(status)
+    conn = _connect()
+    now = time.time()
+    with conn:
+        for paper in papers:
+            row = conn.execute(
+                "SELECT status FROM job_checkpoints WHERE run_id = ? AND arxiv_id = ?", (run_id, paper['arxiv_id'])
+            ).fetchone()
+            if row is not None and CHECKPOINT_STATUSES.index(row[0]) >= rank:
+                continue
+            conn.execute(
+                "INSERT INTO job_checkpoints (run_id, arxiv_id, status, paper, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(run_id, arxiv_id) DO UPDATE SET "
+                "status = excluded.status, paper = excluded.paper, updated_at = excluded.updated_at",
+                (run_id, paper['arxiv_id'], status, _checkpoint_paper_json(paper), now)
+            )
+
+def load_checkpoints(run_id):
+    """Returns [(status, paper)] for every paper recorded in a run, in the order they were first recorded."""
+    rows = _connect().execute(
+        "SELECT status, paper FROM job_checkpoints WHERE run_id = ? ORDER BY rowid", (run_id,)
+    ).fetchall()
+    return [(status, _load_checkpoint_paper(paper_json)) for status, paper_json in rows]
+
+def adopt_legacy_deliveries(profile_names):
+    """
+    Gives analyzed papers recorded before profiles existed a delivery row: delivered
+    papers count as sent to every profile, undelivered ones belong to the first profile.
+    """
+    conn = _connect()
+    now = time.time()
+    orphan_filter = "arxiv_id NOT IN (SELECT arxiv_id FROM profile_deliveries)"
+    with conn:
+        rows = conn.execute(
+            f"SELECT arxiv_id, relevance_score, email_status FROM analyzed_papers WHERE {orphan_filter}"
+        ).fetchall()
+        for arxiv_id, relevance_score, email_status in rows:
+            targets = profile_names if email_status == 'sent' else profile_names[:1]
+            conn.executemany(
+                "INSERT OR IGNORE INTO profile_deliveries (profile, arxiv_id, relevance_score, status, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(profile, arxiv_id, relevance_score, email_status, now) for profile in targets]
+            )
+    return len(rows)
+
+def get_known_paper_ids(profile, arxiv_ids):
+    """
+    Returns the subset of `arxiv_ids` already handled for `profile`: sent to it, or
+    analyzed and waiting in its outbox. Such papers are never selected for it again.
+    """
+    return {arxiv_id for (arxiv_id,) in _select_in(
+        _connect(),
+        "SELECT d.arxiv_id FROM profile_deliveries d LEFT JOIN analyzed_papers a ON a.arxiv_id = d.arxiv_id "
+        "WHERE d.profile = ? AND (d.status = 'sent' OR a.arxiv_id IS NOT NULL) AND d.arxiv_id IN ({})",
+        (profile,), arxiv_ids
+    )}
+
+def queue_deliveries(profile, papers):
+    """
+    Adds `papers` to the outbox of `profile`; they are emailed once analyzed. Papers marked
+    'revised' (content changed since they were delivered) are queued again.
+    """
+    conn = _connect()
+    now = time.time()
+    with conn:
+        conn.executemany(
+            "INSERT INTO profile_deliveries (profile, arxiv_id, relevance_score, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(profile, arxiv_id) DO UPDATE SET status = 'pending', relevance_score = excluded.relevance_score, "
+            "updated_at = excluded.updated_at WHERE ?",
+            [(profile, paper['arxiv_id'], (paper.get('profile_scores') or {}).get(profile, paper.get('relevance_score')), now,
+              bool(paper.get('revised'))) for paper in papers]
+        )
+
+def get_waiting_profiles(arxiv_ids):
+    """Returns {arxiv_id: set of profiles} whose outbox holds the paper but has not sent it yet."""
+    waiting = {arxiv_id: set() for arxiv_id in arxiv_ids}
+    for arxiv_id, profile in _select_in(
+        _connect(),
+        "SELECT arxiv_id, profile FROM profile_deliveries WHERE status NOT IN ('sent', 'queued') AND arxiv_id IN ({})",
+        (), waiting
+    ):
+        waiting[arxiv_id].add(profile)
+    return waiting
+
+def get_undelivered_papers(profile):
+    """
+    Returns the analyzed papers whose digest email to `profile` is still 'pending' or
+    'failed' (not sent and not waiting in the outbox), best score first, as paper dicts (metadata from the latest checkpoint
+    plus the stored analysis, its pre-rendered HTML if any and the profile's score).
+    """
+    conn = _connect()
+    papers = []
+    rows = conn.execute(
+        "SELECT a.arxiv_id, a.title, d.relevance_score, a.analysis, a.analysis_html "
+        "FROM profile_deliveries d JOIN analyzed_papers a ON a.arxiv_id = d.arxiv_id "
+        "WHERE d.profile = ? AND d.status NOT IN ('sent', 'queued') AND a.analysis IS NOT NULL "
+        "ORDER BY d.relevance_score DESC, a.analyzed_at",
+        (profile,)
+    ).fetchall()
+    for arxiv_id, title, relevance_score, analysis, analysis_html in rows:
+        checkpoint = conn.execute(
+            "SELECT paper FROM job_checkpoints WHERE arxiv_id = ? ORDER BY updated_at DESC LIMIT 1", (arxiv_id,)
+        ).fetchone()
+        paper = _load_checkpoint_paper(checkpoint[0]) if checkpoint else {
+            'arxiv_id': arxiv_id, 'summary': '', 'authors': [], 'pdf_url': f"https://arxiv.org/pdf/{arxiv_id}",
+        }
+        paper.update({'title': title, 'relevance_score': relevance_score, 'analysis': analysis})
+        if analysis_html is not None:
+            paper['analysis_html'] = analysis_html
+        papers.append(paper)
+    return papers
+
+def set_delivery_status(profile, arxiv_ids, status):
+    """Records the delivery status ('queued', 'sent' or 'failed') of papers emailed to `profile`."""
+    conn = _connect()
+    now = time.time()
+    with conn:
+        conn.executemany(
+            "UPDATE profile_deliveries SET status = ?, updated_at = ? WHERE profile = ? AND arxiv_id = ?",
+            [(status, now, profile, arxiv_id) for arxiv_id in arxiv_ids]
+        )
+    # The paper-level status is 'sent' only once every profile it was queued for has it.
+    set_email_status(arxiv_ids, status)
+    if status == 'sent':
+        with conn:
+            conn.executemany(
+                "UPDATE analyzed_papers SET email_status = 'pending' WHERE arxiv_id = ? AND EXISTS "
+                "(SELECT 1 FROM profile_deliveries WHERE arxiv_id = ? AND status != 'sent')",
+                [(arxiv_id, arxiv_id) for arxiv_id in arxiv_ids]
+            )
+
+def prune_job_runs(retention_seconds):
+    """Deletes finished job runs (and their checkpoints) older than `retention_seconds`."""
+    conn = _connect()
+    cutoff = time.time() - retention_seconds
+    with conn:
+        conn.execute(
+            "DELETE FROM job_checkpoints WHERE run_id IN "
+            "(SELECT run_id FROM job_runs WHERE status != 'running' AND finished_at < ?)",
+            (cutoff,)
+        )
+        cursor = conn.execute("DELETE FROM job_runs WHERE status != 'running' AND finished_at < ?", (cutoff,))
+    return cursor.rowcount
+
+def enqueue_digest(profile, subject, html, recipient_groups, arxiv_ids):
+    """
+    Persists a digest in the outbox as one message per recipient group and marks its
+    papers 'queued' for `profile`, so they are not put into another digest meanwhile.
+    Returns the digest id.
+    """
+    conn = _connect()
+    digest_id = uuid.uuid4().hex
+    now = time.time()
+    with conn:
+        conn.executemany(
+            "INSERT INTO email_outbox (digest_id, profile, subject, html, recipients, arxiv_ids, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(digest_id, profile, subject, html, json.dumps(recipients), json.dumps(arxiv_ids), now)
+             for recipients in recipient_groups]
+        )
+    set_delivery_status(profile, arxiv_ids, 'queued')
+    return digest_id
+
+def get_queued_emails():
+    """Returns the outbox messages still waiting to be sent, oldest first, as dicts."""
+    rows = _connect().execute(
+        "SELECT id, digest_id, profile, subject, html, recipients, arxiv_ids, attempts "
+        "FROM email_outbox WHERE status = 'queued' ORDER BY id"
+    ).fetchall()
+    return [
+        {'id': row[0], 'digest_id': row[1], 'profile': row[2], 'subject': row[3], 'html': row[4],
+         'recipients': json.loads(row[5]), 'arxiv_ids': json.loads(row[6]), 'attempts': row[7]}
+        for row in rows
+    ]
+
+def record_email_attempt(email, sent, error=None, max_attempts=1):
+    """
+    Records one delivery attempt of an outbox message. A failed message stays queued
+    until it has failed `max_attempts` times. Once no message of its digest is queued
+    any more, the papers' delivery status becomes 'sent' (every message went out) or
+    'failed' (they will be put into a later digest); that status is returned, else None.
+    Each recipient of a sent message is recorded, so a later digest of failed papers
+    skips the recipients that already got them (see get_received_paper_ids).
+    """
+    conn = _connect()
+    now = time.time()
+    attempts = email['attempts'] + 1
+    if sent:
+        status = 'sent'
+    else:
+        status = 'failed' if attempts >= max_attempts else 'queued'
+    with conn:
+        conn.execute(
+            "UPDATE email_outbox SET status = ?, attempts = ?, last_error = ?, sent_at = ? WHERE id = ?",
+            (status, attempts, error, now if sent else None, email['id'])
+        )
+        if sent:
+            conn.executemany(
+                "INSERT OR IGNORE INTO recipient_deliveries (profile, recipient, arxiv_id, sent_at) VALUES (?, ?, ?, ?)",
+                [(email['profile'], recipient, arxiv_id, now)
+                 for recipient in email['recipients'] for arxiv_id in email['arxiv_ids']]
+            )
+    email['attempts'] = attempts
+    statuses = {row[0] for row in conn.execute(
+        "SELECT status FROM email_outbox WHERE digest_id = ?", (email['digest_id'],)
+    )}
+    if 'queued' in statuses:
+        return None
+    digest_status = 'sent' if statuses == {'sent'} else 'failed'
+    set_delivery_status(email['profile'], email['arxiv_ids'], digest_status)
+    return digest_status
+
+def get_received_paper_ids(profile, recipients, arxiv_ids):
+    """Returns {recipient: set of arxiv_ids} of the `arxiv_ids` already emailed to each of `recipients` for `profile`."""
+    received = {recipient: set() for recipient in recipients}
+    for recipient, arxiv_id in _select_in(
+        _connect(),
+        "SELECT recipient, arxiv_id FROM recipient_deliveries WHERE profile = ? AND arxiv_id IN ({})",
+        (profile,), arxiv_ids
+    ):
+        if recipient in received:
+            received[recipient].add(arxiv_id)
+    return received
+
+def prune_outbox(retention_seconds):
+    """Deletes sent or failed outbox messages, and recipient delivery records, older than `retention_seconds`."""
+    conn = _connect()
+    cutoff = time.time() - retention_seconds
+    with conn:
+        cursor = conn.execute("DELETE FROM email_outbox WHERE status != 'queued' AND created_at < ?", (cutoff,))
+        conn.execute("DELETE FROM recipient_deliveries WHERE sent_at < ?", (cutoff,))
+    return cursor.rowcount
+
+def load_analysis_stream(stream_key, prompt_hash):
+    """
+    Returns the saved stream {'text', 'chunks', 'status', 'ttft_s'} of `stream_key` if it
+    was generated from the same prompt, else None. Status is 'streaming' (interrupted),
+    'partial' (kept after failed resumes) or 'complete'.
+    """
+    conn = _connect()
+    row = conn.execute(
+        "SELECT text, chunks, status, ttft_s FROM analysis_streams WHERE stream_key = ? AND prompt_hash = ?",
+        (stream_key, prompt_hash)
+    ).fetchone()
+    if row is None:
+        return None
+    chunks = conn.execute(
+        "SELECT text FROM analysis_stream_chunks WHERE stream_key = ? ORDER BY seq", (stream_key,)
+    ).fetchall()
+    text = row[0] + ''.join(chunk for (chunk,) in chunks)
+    return {'text': text, 'chunks': row[1], 'status': row[2], 'ttft_s': row[3]}
+
+def start_analysis_stream(stream_key, prompt_hash):
+    """Starts (or restarts, discarding any saved text) the stream of `stream_key`."""
+    conn = _connect()
+    now = time.time()
+    with conn:
+        conn.execute("DELETE FROM analysis_stream_chunks WHERE stream_key = ?", (stream_key,))
+        conn.execute(
+            "INSERT OR REPLACE INTO analysis_streams (stream_key, prompt_hash, started_at, updated_at) VALUES (?, ?, ?, ?)",
+            (stream_key, prompt_hash, now, now)
+        )
+
+def append_analysis_chunk(stream_key, text, ttft_s=None):
+    """
+    Durably appends one streamed chunk; `ttft_s` is recorded with the first chunk only.
+    Each chunk is its own row, so an append costs the same however long the stream is.
+    """
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "INSERT INTO analysis_stream_chunks (stream_key, seq, text) "
+            "SELECT stream_key, chunks, ? FROM analysis_streams WHERE stream_key = ?",
+            (text, stream_key)
+        )
+        conn.execute(
+            "UPDATE analysis_streams SET chunks = chunks + 1, "
+            "ttft_s = COALESCE(ttft_s, ?), status = 'streaming', updated_at = ? WHERE stream_key = ?",
+            (ttft_s, time.time(), stream_key)
+        )
+
+def finish_analysis_stream(stream_key, status):
+    """Marks the stream of `stream_key` 'complete' or 'partial'."""
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "UPDATE analysis_streams SET status = ?, updated_at = ? WHERE stream_key = ?",
+            (status, time.time(), stream_key)
+        )
+
+def prune_analysis_streams(retention_seconds):
+    """Deletes saved analysis streams not updated for `retention_seconds`."""
+    conn = _connect()
+    cutoff = time.time() - retention_seconds
+    with conn:
+        conn.execute(
+            "DELETE FROM analysis_stream_chunks WHERE stream_key IN "
+            "(SELECT stream_key FROM analysis_streams WHERE updated_at < ?)", (cutoff,)
+        )
+        cursor = conn.execute("DELETE FROM analysis_streams WHERE updated_at < ?", (cutoff,))
+    return cursor.rowcount
+
+def get_last_fire_times():
+    """Returns {profile: unix time} of each profile's last scheduled run."""
+    return dict(_connect().execute("SELECT profile, last_fire_at FROM schedule_state").fetchall())
+
+def record_fire(profile_names, fire_at):
+    """Records that the scheduled runs of `profile_names` were started at `fire_at` (unix time)."""
+    conn = _connect()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO schedule_state (profile, last_fire_at) VALUES (?, ?)",
+            [(name, fire_at) for name in profile_names]
+        )
+
+def get_analysis_batch(batch_key, max_age_seconds):
+    """Returns the name of the Gemini batch job submitted for `batch_key` within `max_age_seconds`, or None."""
+    row = _connect().execute(
+        "SELECT job_name FROM analysis_batches WHERE batch_key = ? AND submitted_at >= ?",
+        (batch_key, time.time() - max_age_seconds)
+    ).fetchone()
+    return row[0] if row else None
+
+def save_analysis_batch(batch_key, job_name):
+    """Records the Gemini batch job submitted for the set of analysis requests `batch_key`."""
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO analysis_batches (batch_key, job_name, submitted_at) VALUES (?, ?, ?)",
+            (batch_key, job_name, time.time())
+        )
+
+def finish_analysis_batch(batch_key):
+    """Forgets the batch job of `batch_key` once its results are collected (or it was given up)."""
+    conn = _connect()
+    with conn:
+        conn.execute("DELETE FROM analysis_batches WHERE batch_key = ?", (batch_key,))
+
+def get_pdf_analyses(cache_keys):
+    """Returns {cache_key: {'source', 'title', 'analysis', 'analysis_html'}} of PDFs analyzed by --pdf batches."""
+    return {
+        row[0]: {'source': row[1], 'title': row[2], 'analysis': row[3], 'analysis_html': row[4]}
+        for row in _select_in(
+            _connect(),
+            "SELECT cache_key, source, title, analysis, analysis_html FROM pdf_analyses WHERE cache_key IN ({})",
+            (), cache_keys
+        )
+    }
+
+def save_pdf_analysis(cache_key, source, title, analysis, analysis_html=None):
+    """Records the analysis of a local or URL PDF, keyed by its content hash or URL cache key."""
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO pdf_analyses (cache_key, source, title, analysis, analysis_html, analyzed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (cache_key, source, title, analysis, analysis_html, time.time())
+        )
+
+def get_dedup_signatures(arxiv_ids):
+    """Returns {arxiv_id: signature bytes} of the given papers in the near-duplicate index."""
+    return dict(_select_in(
+        _connect(), "SELECT arxiv_id, signature FROM dedup_signatures WHERE arxiv_id IN ({})", (), arxiv_ids
+    ))
+
+def find_dedup_candidates(band_buckets):
+    """Returns the IDs of indexed papers sharing at least one (band, bucket) pair with `band_buckets`."""
+    band_buckets = list(band_buckets)
+    if not band_buckets:
+        return set()
+    # One query; SQLite answers each (band = ? AND bucket = ?) term from the primary key index.
+    condition = ' OR '.join(['(band = ? AND bucket = ?)'] * len(band_buckets))
+    return {arxiv_id for (arxiv_id,) in _connect().execute(
+        f"SELECT DISTINCT arxiv_id FROM dedup_buckets WHERE {condition}",
+        [value for band_bucket in band_buckets for value in band_bucket]
+    )}
+
+def save_dedup_signature(arxiv_id, signature, band_buckets):
+    """Adds (or replaces) a paper's MinHash signature and LSH buckets in the near-duplicate index."""
+    conn = _connect()
+    with conn:
+        conn.execute("DELETE FROM dedup_buckets WHERE arxiv_id = ?", (arxiv_id,))
+        conn.executemany(
+            "INSERT OR IGNORE INTO dedup_buckets (band, bucket, arxiv_id) VALUES (?, ?, ?)",
+            [(band, bucket, arxiv_id) for band, bucket in band_buckets]
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO dedup_signatures (arxiv_id, signature, updated_at) VALUES (?, ?, ?)",
+            (arxiv_id, signature, time.time())
+        )
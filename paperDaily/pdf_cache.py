@@ -0,0 +1,165 @@
+import collections
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from config import PDF_CACHE_DIR, PDF_CACHE_MAX_MB
+
+# Matches new-style (2510.14973v1) and old-style (hep-th/9901001v1) arXiv IDs at the end of a URL
+_ARXIV_URL_RE = re.compile(r'arxiv\.org/(?:pdf|abs)/(.+?)(?:\.pdf)?/?$')
+_PDF_SUFFIX = '.pdf'
+_TEXT_SUFFIX = '.txt'
+
+# Eviction frees space down to this fraction of the limit, so a full cache is not
+# rescanned on every following write.
+_EVICT_TO_FRACTION = 0.9
+
+_eviction_lock = threading.Lock() # Guards _cache_size and _pinned_keys
+_cache_size = None # Approximate bytes in the cache; None until the first scan
+_pinned_keys = collections.Counter() # Keys whose PDF was handed out and not yet released
+
+
+def cache_key_for_url(pdf_url):
+    """
+    Returns the cache key for a PDF URL: the arXiv ID for arXiv links,
+    otherwise a hash of the URL.
+    """
+    match = _ARXIV_URL_RE.search(pdf_url)
+    if match:
+        return "arxiv-" + match.group(1).replace('/', '_')
+    return "url-" + hashlib.sha256(pdf_url.encode('utf-8')).hexdigest()
+
+def cache_key_for_file(pdf_path):
+    """Returns the cache key for a local PDF: the SHA-256 of its content."""
+    digest = hashlib.sha256()
+    with open(pdf_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return "sha256-" + digest.hexdigest()
+
+def _cache_path(key, suffix):
+    return os.path.join(PDF_CACHE_DIR, key + suffix)
+
+def get_cached_text(key):
+    """Returns the cached extracted text for `key`, or None."""
+    path = _cache_path(key, _TEXT_SUFFIX)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+    except OSError:
+        return None
+    try:
+        os.utime(path) # Mark as recently used for LRU eviction
+    except OSError:
+        pass
+    return text
+
+def put_cached_text(key, text):
+    """Atomically writes extracted text into the cache, then enforces the size limit."""
+    try:
+        os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=PDF_CACHE_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        path = _cache_path(key, _TEXT_SUFFIX)
+        os.replace(tmp_path, path)
+        _account_write(os.path.getsize(path))
+    except OSError as e:
+        print(f"Warning: Could not write {key}{_TEXT_SUFFIX} to PDF cache: {e}")
+
+def get_cached_pdf_path(key):
+    """
+    Returns the path of the cached PDF for `key` (marking it recently used), or None.
+    The entry is pinned against eviction until release_cached_pdf(path) is called.
+    """
+    path = _cache_path(key, _PDF_SUFFIX)
+    with _eviction_lock:
+        try:
+            os.utime(path) # Mark as recently used for LRU eviction
+        except OSError:
+            return None
+        _pinned_keys[key] += 1
+    return path
+
+def release_cached_pdf(pdf_path):
+    """Unpins a PDF returned by get_cached_pdf_path or put_cached_pdf_file; unpinned paths are ignored."""
+    key = os.path.splitext(os.path.basename(pdf_path))[0]
+    with _eviction_lock:
+        if _pinned_keys[key] > 1:
+            _pinned_keys[key] -= 1
+        else:
+            _pinned_keys.pop(key, None)
+
+def new_pdf_cache_tempfile():
+    """Opens a temporary file inside the cache directory for streaming a download into."""
+    os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+    return tempfile.NamedTemporaryFile(dir=PDF_CACHE_DIR, suffix='.tmp', delete=False)
+
+def put_cached_pdf_file(key, tmp_path):
+    """
+    Moves a fully written PDF (e.g. from new_pdf_cache_tempfile) into the cache and
+    returns its cached path, pinned until release_cached_pdf(path) is called.
+    """
+    path = _cache_path(key, _PDF_SUFFIX)
+    with _eviction_lock:
+        os.replace(tmp_path, path)
+        _pinned_keys[key] += 1
+    _account_write(os.path.getsize(path))
+    return path
+
+def _account_write(size):
+    # Adds a write to the running cache size and scans the directory only once the
+    # limit is exceeded (or on the first write, when the size is still unknown).
+    global _cache_size
+    with _eviction_lock:
+        if _cache_size is not None:
+            _cache_size += size
+            if _cache_size <= PDF_CACHE_MAX_MB * 1024 * 1024:
+                return
+    evict_pdf_cache()
+
+def evict_pdf_cache(max_bytes=None):
+    """
+    Removes least-recently-used entries (PDF and text together) until the cache
+    fits in `max_bytes` (defaults to PDF_CACHE_MAX_MB); when over the limit, frees
+    space down to 90% of it. Pinned entries are never removed.
+    """
+    global _cache_size
+    if max_bytes is None:
+        max_bytes = PDF_CACHE_MAX_MB * 1024 * 1024
+    with _eviction_lock:
+        entries = {} # key -> [last_used, total_size, paths]
+        total_size = 0
+        try:
+            names = os.listdir(PDF_CACHE_DIR)
+        except OSError:
+            return
+        for name in names:
+            key, suffix = os.path.splitext(name)
+            if suffix not in (_PDF_SUFFIX, _TEXT_SUFFIX):
+                continue
+            path = os.path.join(PDF_CACHE_DIR, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entry = entries.setdefault(key, [0.0, 0, []])
+            entry[0] = max(entry[0], stat.st_mtime)
+            entry[1] += stat.st_size
+            entry[2].append(path)
+            total_size += stat.st_size
+
+        target_size = max_bytes * _EVICT_TO_FRACTION if total_size > max_bytes else max_bytes
+        for key, (_, size, paths) in sorted(entries.items(), key=lambda item: item[1][0]):
+            if total_size <= target_size:
+                break
+            if key in _pinned_keys:
+                continue # Handed out by download_pdf and possibly not opened yet
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total_size -= size
+        _cache_size = total_size
@@ -0,0 +1,118 @@
+import os
+import sys
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+from config import EXTRACT_MAX_PAGES, EXTRACT_MAX_CHARS, EXTRACT_MAX_RSS_MB
+import metrics
+from pdf_cache import cache_key_for_url, get_cached_pdf_path, new_pdf_cache_tempfile, put_cached_pdf_file, release_cached_pdf
+
+_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+# requests and PyMuPDF are imported inside the functions that use them, keeping startup light.
+
+
+def _current_rss_bytes():
+    """Returns the current resident set size of this process (0 where it cannot be measured)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        if resource is None:
+            return 0 # Windows: no RSS budget
+        # Not on Linux: fall back to the process high-water mark (KiB on Linux, bytes on macOS).
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+def download_pdf(pdf_url):
+    """
+    Streams a PDF to a file in the PDF cache and returns its path, so the response
+    body is never held in memory. Repeat downloads are served from the cache.
+    The returned file is pinned against cache eviction; pass it to release_pdf()
+    once it has been read.
+    """
+    import requests
+    cache_key = cache_key_for_url(pdf_url)
+    pdf_path = get_cached_pdf_path(cache_key)
+    if pdf_path is not None:
+        metrics.increment('pdf_cache_hits')
+        return pdf_path
+    tmp = None
+    try:
+        with requests.get(pdf_url, timeout=10, stream=True) as response:
+            response.raise_for_status()  # Raise an exception for bad status codes
+            with new_pdf_cache_tempfile() as tmp:
+                for chunk in response.iter_content(chunk_size=_DOWNLOAD_CHUNK_SIZE):
+                    tmp.write(chunk)
+                    metrics.increment('bytes_downloaded', len(chunk))
+        return put_cached_pdf_file(cache_key, tmp.name)
+    except (requests.exceptions.RequestException, OSError) as e:
+        print(f"Error downloading {pdf_url}: {e}")
+        if tmp is not None and os.path.exists(tmp.name):
+            os.remove(tmp.name)
+        return None
+
+def release_pdf(pdf_path):
+    """Lets the cache evict a PDF returned by download_pdf again."""
+    release_cached_pdf(pdf_path)
+
+def iter_pdf_pages(pdf_path, max_pages=None):
+    """
+    Lazily yields the text of each page of a PDF file. PyMuPDF loads pages on
+    demand, so only the current page is materialised at a time.
+    """
+    import fitz  # PyMuPDF
+    with fitz.open(pdf_path) as doc:
+        for page_number, page in enumerate(doc):
+            if max_pages is not None and page_number >= max_pages:
+                break
+            yield page.get_text()
+
+def extract_pdf_text(pdf_path, max_pages=EXTRACT_MAX_PAGES, max_chars=EXTRACT_MAX_CHARS,
+                     max_rss_mb=EXTRACT_MAX_RSS_MB, source=None):
+    """
+    Extracts text from a PDF file page by page, stopping early once `max_pages`
+    pages or `max_chars` characters have been read, or the process RSS exceeds
+    `max_rss_mb`. Any budget set to None is unlimited.
+    Returns (text, stats) where stats holds the pages and characters extracted,
+    whether the text was truncated and the peak RSS (MB) seen while extracting;
+    text is None on failure.
+    """
+    rss_ceiling = max_rss_mb * 1024 * 1024 if max_rss_mb else None
+    parts = []
+    chars = 0
+    pages = 0
+    truncated = False
+    peak_rss = _current_rss_bytes()
+    try:
+        for page_text in iter_pdf_pages(pdf_path):
+            if max_pages is not None and pages >= max_pages:
+                truncated = True
+                break
+            if max_chars is not None and chars + len(page_text) > max_chars:
+                parts.append(page_text[:max_chars - chars])
+                chars = max_chars
+                pages += 1
+                truncated = True
+                break
+            parts.append(page_text)
+            chars += len(page_text)
+            pages += 1
+            peak_rss = max(peak_rss, _current_rss_bytes())
+            if rss_ceiling is not None and peak_rss > rss_ceiling:
+                print(f"Warning: Stopping extraction of {source or pdf_path} after {pages} pages: RSS above {max_rss_mb} MB.")
+                truncated = True
+                break
+    except Exception as e:
+        print(f"Error processing PDF from {source or pdf_path}: {e}")
+        return None, None
+
+    stats = {
+        'pages': pages,
+        'chars': chars,
+        'truncated': truncated,
+        'peak_rss_mb': round(peak_rss / (1024 * 1024), 1),
+    }
+    return "".join(parts), stats
@@ -0,0 +1,256 @@
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from pdf_extractor import download_pdf, extract_pdf_text, release_pdf
+from gemini_analyzer import analyze_paper_content, analyze_papers_deferred
+from markdown_renderer import MarkdownRenderer, render_markdown
+from pdf_cache import cache_key_for_url, get_cached_text, put_cached_text
+from config import (
+    PDF_DOWNLOAD_WORKERS, PDF_EXTRACT_WORKERS, ANALYSIS_WORKERS, PIPELINE_QUEUE_SIZE, ANALYSIS_MODE, ANALYSIS_BATCH_DEADLINE,
+    ANALYSIS_BATCH_WAIT_MINUTES
+)
+import metrics
+import time
+
+_STOP = object() # Sentinel telling a stage worker to exit
+
+
+def _start_stage(name, worker_count, handle_item, in_queue, out_queue=None):
+    """
+    Starts `worker_count` threads that take items from `in_queue`, pass them to
+    `handle_item` and put any non-None result on `out_queue`.
+    """
+    def worker():
+        while True:
+            item = in_queue.get()
+            if item is _STOP:
+                break
+            try:
+                result = handle_item(item)
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                print(f"  Error in {name} stage: {e}")
+                continue
+            if result is not None and out_queue is not None:
+                out_queue.put(result)
+
+    threads = [threading.Thread(target=worker, name=f"{name}-{i}", daemon=True) for i in range(max(1, worker_count))]
+    for thread in threads:
+        thread.start()
+    return threads
+
+def _close_stage(threads, in_queue):
+    """Waits for a stage to drain `in_queue` and for all of its workers to exit."""
+    for _ in threads:
+        in_queue.put(_STOP)
+    for thread in threads:
+        thread.join()
+
+def _text_cache_key(paper):
+    # Local PDFs carry the hash of their content as 'cache_key'; URLs are keyed by the URL.
+    return paper.get('cache_key') or cache_key_for_url(paper['pdf_url'])
+
+def batch_deadline(now=None):
+    """
+    The unix time by which a batch job started at `now` must be done: ANALYSIS_BATCH_WAIT_MINUTES
+    later or, if ANALYSIS_BATCH_DEADLINE (local HH:MM) is set, that time on the same day.
+    A fixed deadline that has already passed is returned as is (the run then skips batch mode)
+    rather than moved to tomorrow, which would hold back the digest and the job lock for a day.
+    """
+    now = now or datetime.now()
+    if not ANALYSIS_BATCH_DEADLINE:
+        return (now + timedelta(minutes=ANALYSIS_BATCH_WAIT_MINUTES)).timestamp()
+    hour, minute = (int(part) for part in ANALYSIS_BATCH_DEADLINE.split(':'))
+    return now.replace(hour=hour, minute=minute, second=0, microsecond=0).timestamp()
+
+def run_analysis_pipeline(papers, on_analyzed=None, on_downloaded=None, mode=None):
+    """
+    Downloads, extracts and analyzes `papers` concurrently in three stages connected by
+    bounded queues: a download thread pool, a PyMuPDF extraction process pool and an
+    analysis stage capped at ANALYSIS_WORKERS concurrent Gemini calls.
+    In 'batch' `mode` (default: ANALYSIS_MODE) the analysis stage only collects the extracted texts; they are then
+    analyzed by one Gemini batch job (see gemini_analyzer.analyze_papers_deferred) and
+    whatever it leaves out goes through the interactive analysis stage afterwards.
+    Papers with a 'pdf_path' (local files) skip the download.
+    `on_downloaded(paper)` and `on_analyzed(paper)` are called (serialized) as soon as a
+    paper's text is available and as soon as it is analyzed, respectively.
+    Returns the analyzed papers in the same order as `papers`.
+    """
+    total = len(papers)
+    if not total:
+        return []
+    mode = mode or ANALYSIS_MODE
+    deadline = batch_deadline() if mode == 'batch' else None
+    if deadline is not None and deadline <= time.time():
+        print(f"The batch deadline {ANALYSIS_BATCH_DEADLINE} has already passed; analyzing interactively.")
+        mode = 'interactive'
+
+    download_queue = queue.Queue()
+    extract_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    analysis_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    results = [None] * total
+    results_lock = threading.Lock()
+    from tqdm import tqdm
+    progress = tqdm(total=total, desc="Analyzing papers")
+
+    # PyMuPDF is not thread-safe, so extraction runs in separate (spawned) processes.
+    extract_executor = ProcessPoolExecutor(
+        max_workers=max(1, PDF_EXTRACT_WORKERS),
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+    def notify_downloaded(paper):
+        if on_downloaded is not None:
+            with results_lock:
+                on_downloaded(paper)
+
+    def download(item):
+        i, paper = item
+        content = get_cached_text(_text_cache_key(paper))
+        if content:
+            print(f"  ({i + 1}/{total}) Using cached text for '{paper['title']}'")
+            notify_downloaded(paper)
+            analysis_queue.put((i, paper, content))
+            return None
+        if paper.get('pdf_path'):
+            notify_downloaded(paper)
+            return i, paper, paper['pdf_path']
+        print(f"  ({i + 1}/{total}) Downloading PDF for '{paper['title']}'")
+        started_at = time.perf_counter()
+        pdf_path = download_pdf(paper['pdf_url'])
+        metrics.observe('download', time.perf_counter() - started_at)
+        if pdf_path is None:
+            print(f"  Skipping analysis for '{paper['title']}' due to PDF download failure.")
+            progress.update(1)
+            return None
+        notify_downloaded(paper)
+        return i, paper, pdf_path
+
+    def extract(item):
+        i, paper, pdf_path = item
+        started_at = time.perf_counter()
+        try:
+            content, stats = extract_executor.submit(extract_pdf_text, pdf_path, source=paper['pdf_url']).result()
+        finally:
+            if not paper.get('pdf_path'):
+                release_pdf(pdf_path) # Downloaded into the cache; it may be evicted again
+        metrics.observe('extract', time.perf_counter() - started_at)
+        if not content:
+            print(f"  Skipping analysis for '{paper['title']}' due to PDF extraction failure.")
+            progress.update(1)
+            return None
+        print(f"  ({i + 1}/{total}) Extracted {stats['pages']} pages / {stats['chars']} chars from '{paper['title']}'"
+              f"{' (truncated)' if stats['truncated'] else ''}, peak RSS {stats['peak_rss_mb']} MB")
+        metrics.increment('pages_extracted', stats['pages'])
+        if not stats['truncated']:
+            # Text cut by the extraction budgets is not cached, so raising them takes effect.
+            put_cached_text(_text_cache_key(paper), content)
+        return i, paper, content
+
+    def stream_key_for(paper):
+        return paper.get('arxiv_id') or _text_cache_key(paper)
+
+    def record_analysis(i, paper, content, analysis, analysis_html, prompt_stats):
+        metrics.increment('prompt_tokens', prompt_stats.get('usage_prompt_tokens') or prompt_stats.get('prompt_tokens', 0))
+        metrics.increment('response_tokens', prompt_stats.get('usage_response_tokens') or 0)
+        if prompt_stats.get('batch'):
+            # Streamed calls record cached tokens in gemini_client; batch results arrive here.
+            metrics.increment('batch_prompt_tokens', prompt_stats.get('usage_prompt_tokens') or prompt_stats.get('prompt_tokens', 0))
+            metrics.increment('cached_prompt_tokens', prompt_stats.get('usage_cached_tokens') or 0)
+        if analysis is None:
+            print(f"  Skipping '{paper['title']}' because its analysis failed.")
+            progress.update(1)
+            return
+        if prompt_stats:
+            ttft = f", first token after {prompt_stats['ttft_s']:.2f}s" if prompt_stats.get('ttft_s') is not None else ""
+            map_reduce = (f"; map-reduced from {prompt_stats['map_chunks']} chunk(s) of at most "
+                          f"~{prompt_stats['map_peak_prompt_tokens']} prompt tokens") if prompt_stats.get('map_chunks') else ""
+            batch = ", via batch job" if prompt_stats.get('batch') else ""
+            print(f"  ({i + 1}/{total}) Prompt for '{paper['title']}': ~{prompt_stats['prompt_tokens']} tokens "
+                  f"(paper text ~{prompt_stats['original_tokens']} -> ~{prompt_stats['content_tokens']}{map_reduce}){ttft}{batch}")
+        analyzed_paper = {
+            **paper,
+            'content': content, # Add content for completeness if needed later
+            'analysis': analysis,
+            'analysis_html': analysis_html,
+            'prompt_stats': prompt_stats
+        }
+        with results_lock:
+            results[i] = analyzed_paper
+            if on_analyzed is not None:
+                on_analyzed(analyzed_paper)
+            progress.update(1)
+
+    def analyze(item):
+        i, paper, content = item
+        print(f"  ({i + 1}/{total}) Analyzing '{paper['title']}' (ID: {paper.get('arxiv_id', 'N/A')})")
+        prompt_stats = {}
+        # The digest HTML is rendered chunk by chunk while the analysis streams in.
+        renderer = MarkdownRenderer()
+        html_parts = []
+        started_at = time.perf_counter()
+        analysis = analyze_paper_content(
+            content, stats=prompt_stats, stream_key=stream_key_for(paper),
+            on_chunk=lambda text: html_parts.append(renderer.feed(text))
+        )
+        metrics.observe('analysis', time.perf_counter() - started_at)
+        if prompt_stats.get('ttft_s') is not None:
+            metrics.observe('analysis_first_token', prompt_stats['ttft_s'])
+        if prompt_stats.get('partial'):
+            metrics.increment('partial_analyses')
+        if prompt_stats.get('map_chunks'):
+            metrics.observe('analysis_map', prompt_stats['map_s'])
+            metrics.increment('map_reduced_papers')
+            metrics.increment('map_prompt_tokens', prompt_stats['map_prompt_tokens'])
+        analysis_html = ''.join(html_parts) + renderer.close() if analysis is not None else None
+        record_analysis(i, paper, content, analysis, analysis_html, prompt_stats)
+        return None
+
+    def analyze_deferred(items):
+        """Runs the batch job over the collected `items`; returns the ones it left for interactive analysis."""
+        print(f"Submitting {len(items)} analyses as one Gemini batch job...")
+        started_at = time.perf_counter()
+        collected = analyze_papers_deferred(
+            [(stream_key_for(paper), content) for _, paper, content in items], deadline
+        )
+        metrics.observe('analysis_batch', time.perf_counter() - started_at)
+        leftovers = []
+        for i, paper, content in items:
+            if stream_key_for(paper) not in collected:
+                leftovers.append((i, paper, content))
+                continue
+            analysis, prompt_stats = collected[stream_key_for(paper)]
+            metrics.increment('batch_analyses')
+            record_analysis(i, paper, content, analysis, render_markdown(analysis), prompt_stats)
+        return leftovers
+
+    try:
+        download_threads = _start_stage("download", PDF_DOWNLOAD_WORKERS, download, download_queue, extract_queue)
+        extract_threads = _start_stage("extract", PDF_EXTRACT_WORKERS, extract, extract_queue, analysis_queue)
+        deferred = [] # Extracted papers collected for the batch job in 'batch' mode
+        analysis_threads = _start_stage(
+            "analyze", ANALYSIS_WORKERS, deferred.append if mode == 'batch' else analyze, analysis_queue
+        )
+
+        for item in enumerate(papers):
+            download_queue.put(item)
+
+        _close_stage(download_threads, download_queue)
+        _close_stage(extract_threads, extract_queue)
+        _close_stage(analysis_threads, analysis_queue)
+
+        leftovers = analyze_deferred(sorted(deferred, key=lambda item: item[0])) if deferred else []
+        if leftovers:
+            print(f"Analyzing {len(leftovers)} paper(s) the batch job did not cover interactively...")
+            analysis_threads = _start_stage("analyze", ANALYSIS_WORKERS, analyze, analysis_queue)
+            for item in leftovers:
+                analysis_queue.put(item)
+            _close_stage(analysis_threads, analysis_queue)
+    finally:
+        extract_executor.shutdown()
+        progress.close()
+
+    return [paper for paper in results if paper is not None]
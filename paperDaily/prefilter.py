@@ -0,0 +1,89 @@
+import math
+import re
+from collections import Counter
+import numpy as np
+from config import ARXIV_QUERY, PREFILTER_TOP_K, PREFILTER_MIN_SIMILARITY
+
+_WORD_RE = re.compile(r'[a-z0-9]+(?:-[a-z0-9]+)*')
+_QUERY_PHRASE_RE = re.compile(r'"([^"]+)"|([^\s()"]+)')
+_QUERY_OPERATORS = {'and', 'or', 'andnot', 'not'}
+_STOPWORDS = frozenset("""
+a an the of for in on to and or with by from as at is are was were be been this that these those
+we our us it its their can via using based into over under than then also which such not no
+""".split())
+
+
+def _tokenize(text):
+    """Lower-cased unigrams plus adjacent bigrams (so phrases like 'world model' match as a unit)."""
+    words = [w for w in _WORD_RE.findall(text.lower()) if len(w) > 1 and w not in _STOPWORDS]
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+def _query_terms(query):
+    """Extracts the search terms of an arXiv query string, ignoring boolean operators."""
+    terms = []
+    for phrase, word in _QUERY_PHRASE_RE.findall(query):
+        text = phrase or word
+        if text.lower() in _QUERY_OPERATORS or ':' in text:
+            continue
+        terms.extend(_tokenize(text))
+    return terms
+
+def similarity_scores(documents, query=ARXIV_QUERY):
+    """
+    Returns a NumPy array with the TF-IDF cosine similarity of each document to the
+    search terms of `query`. Weights use sublinear term frequency and smoothed IDF
+    computed over `documents`; all per-term work is vectorised.
+    """
+    query_counts = Counter(_query_terms(query))
+    if not documents or not query_counts:
+        return np.zeros(len(documents))
+
+    vocabulary = {}
+    rows, cols, counts = [], [], []
+    for row, document in enumerate(documents):
+        for term, count in Counter(_tokenize(document)).items():
+            rows.append(row)
+            cols.append(vocabulary.setdefault(term, len(vocabulary)))
+            counts.append(count)
+    for term in query_counts:
+        vocabulary.setdefault(term, len(vocabulary))
+
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.float64)
+    n_documents, n_terms = len(documents), len(vocabulary)
+
+    document_frequency = np.bincount(cols, minlength=n_terms)
+    idf = np.log((1 + n_documents) / (1 + document_frequency)) + 1.0
+    weights = (1.0 + np.log(counts)) * idf[cols]
+
+    query_vector = np.zeros(n_terms)
+    for term, count in query_counts.items():
+        query_vector[vocabulary[term]] = (1.0 + math.log(count)) * idf[vocabulary[term]]
+
+    document_norms = np.sqrt(np.bincount(rows, weights=weights ** 2, minlength=n_documents))
+    dot_products = np.bincount(rows, weights=weights * query_vector[cols], minlength=n_documents)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        similarities = dot_products / (document_norms * np.linalg.norm(query_vector))
+    return np.nan_to_num(similarities)
+
+def prefilter_papers(papers, top_k=PREFILTER_TOP_K, min_similarity=PREFILTER_MIN_SIMILARITY, query=ARXIV_QUERY):
+    """
+    Ranks paper metadata dicts by title+summary similarity to `query` and returns
+    (kept, dropped): at most `top_k` papers with similarity >= `min_similarity`,
+    best first, and the rest. Each paper gets a 'prefilter_similarity' entry.
+    """
+    if not papers:
+        return [], []
+    similarities = similarity_scores([f"{paper['title']}\n{paper['summary']}" for paper in papers], query)
+    for paper, similarity in zip(papers, similarities):
+        paper['prefilter_similarity'] = round(float(similarity), 4)
+
+    order = np.argsort(-similarities, kind='stable')
+    keep = order[similarities[order] >= min_similarity]
+    if top_k is not None:
+        keep = keep[:top_k]
+    keep_set = set(keep.tolist())
+    kept = [papers[i] for i in keep]
+    dropped = [paper for i, paper in enumerate(papers) if i not in keep_set]
+    return kept, dropped
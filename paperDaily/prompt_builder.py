@@ -0,0 +1,176 @@
+import re
+from config import ANALYSIS_PROMPT_TOKEN_BUDGET, SECTION_MIN_KEEP_CHARS
+
+# CJK ideographs, kana and full-width punctuation are roughly one token each;
+# other text averages about four characters per token for Gemini's tokenizer.
+_CJK_RE = re.compile(r'[　-ヿ㐀-䶿一-鿿가-힯＀-￯]')
+_CHARS_PER_TOKEN = 4
+
+# Section headings as they appear in extracted PDF text, e.g. "3 Method", "IV. EXPERIMENTS", "References".
+_SECTION_PATTERNS = [
+    ('abstract', r'abstract'),
+    ('introduction', r'introduction'),
+    ('related_work', r'related\s+work|background|preliminaries'),
+    ('method', r'methods?|methodology|approach|proposed\s+(?:method|approach)'),
+    ('experiments', r'experiments?|experimental\s+(?:setup|results)|evaluation|results'),
+    ('discussion', r'discussion|analysis|limitations'),
+    ('conclusion', r'conclusions?|concluding\s+remarks'),
+    ('acknowledgements', r'acknowledge?ments?'),
+    ('references', r'references|bibliography'),
+    ('appendix', r'appendix|appendices|supplementary\s+material'),
+]
+_HEADING_RE = re.compile(
+    r'^[ \t]*(?:(?:\d+|[IVX]+|[A-Z])(?:\.\d+)*\.?[ \t]+)?(?:'
+    + '|'.join(f'(?P<{name}>{pattern})' for name, pattern in _SECTION_PATTERNS)
+    + r')[ \t]*:?[ \t]*$',
+    re.IGNORECASE | re.MULTILINE
+)
+
+# Higher priority sections are kept longest; priority 0 sections are dropped first.
+SECTION_PRIORITIES = {
+    'front_matter': 5, # Title, authors, affiliations (needed for the author/institution analysis)
+    'abstract': 5,
+    'introduction': 4,
+    'method': 4,
+    'conclusion': 4,
+    'experiments': 3,
+    'discussion': 2,
+    'related_work': 1,
+    'acknowledgements': 0,
+    'references': 0,
+    'appendix': 0,
+}
+
+
+def estimate_tokens(text):
+    """Returns a local estimate of the number of Gemini tokens in `text`."""
+    if not text:
+        return 0
+    cjk_chars = len(_CJK_RE.findall(text))
+    return cjk_chars + (len(text) - cjk_chars + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
+
+def split_sections(content):
+    """
+    Splits extracted paper text into [(section_name, text)] using detected headings.
+    Text before the first heading is 'front_matter'. Once References or an Appendix
+    starts, later headings are treated as part of that back matter.
+    """
+    sections = []
+    current_name, current_start = 'front_matter', 0
+    for match in _HEADING_RE.finditer(content):
+        if current_name in ('references', 'appendix'):
+            # Appendix may follow references; everything else is back matter.
+            if current_name == 'appendix' or match.lastgroup != 'appendix':
+                continue
+        sections.append((current_name, content[current_start:match.start()]))
+        current_name, current_start = match.lastgroup, match.start()
+    sections.append((current_name, content[current_start:]))
+    return [(name, text) for name, text in sections if text.strip()]
+
+def fit_content_to_budget(content, token_budget):
+    """
+    Shrinks paper text to roughly `token_budget` tokens. Zero-priority sections
+    (references, acknowledgements, appendix) are dropped first, then the remaining
+    sections are truncated from the lowest priority upwards, keeping at least the
+    beginning of each section.
+    Returns (text, stats) with the original and final token counts and the names
+    of the dropped and compressed sections.
+    """
+    original_tokens = estimate_tokens(content)
+    stats = {
+        'original_tokens': original_tokens,
+        'content_tokens': original_tokens,
+        'dropped_sections': [],
+        'compressed_sections': [],
+    }
+    if original_tokens <= token_budget:
+        return content, stats
+
+    sections = [[name, text, estimate_tokens(text)] for name, text in split_sections(content)]
+    total = sum(tokens for _, _, tokens in sections)
+
+    for section in sections:
+        if total <= token_budget:
+            break
+        name, _, tokens = section
+        if SECTION_PRIORITIES.get(name, 1) == 0:
+            stats['dropped_sections'].append(name)
+            section[1], section[2] = '', 0
+            total -= tokens
+
+    for priority in sorted(set(SECTION_PRIORITIES.values()) - {0}):
+        if total <= token_budget:
+            break
+        for section in sections:
+            if total <= token_budget:
+                break
+            name, text, tokens = section
+            if SECTION_PRIORITIES.get(name, 1) != priority or not tokens:
+                continue
+            keep_tokens = max(tokens - (total - token_budget), 0)
+            keep_chars = max(int(len(text) * keep_tokens / tokens), min(SECTION_MIN_KEEP_CHARS, len(text)))
+            if keep_chars >= len(text):
+                continue
+            section[1] = text[:keep_chars] + "\n[...]\n"
+            section[2] = estimate_tokens(section[1])
+            total -= tokens - section[2]
+            stats['compressed_sections'].append(name)
+
+    text = "".join(section_text for _, section_text, _ in sections)
+    if total > token_budget:
+        # Every section is already at its minimum; hard-truncate as a last resort.
+        text = text[:int(len(text) * token_budget / total)]
+    stats['content_tokens'] = estimate_tokens(text)
+    return text, stats
+
+def _split_lines(text, max_chars):
+    # Lines of `text`, with single overlong lines (text extracted without line breaks) cut by length.
+    for line in text.splitlines(keepends=True):
+        for start in range(0, len(line), max_chars):
+            yield line[start:start + max_chars]
+
+def split_into_chunks(content, chunk_tokens):
+    """
+    Splits paper text into chunks of about `chunk_tokens` estimated tokens along section
+    boundaries: a section that fits in a fresh chunk but not in the current one starts a
+    new chunk, longer sections fill chunks line by line. Zero-priority back matter
+    (references, acknowledgements, appendix) is left out unless nothing else remains.
+    Returns [(section_names, text)].
+    """
+    sections = split_sections(content)
+    kept = [(name, text) for name, text in sections if SECTION_PRIORITIES.get(name, 1) != 0] or sections
+    chunks = []
+    names, parts, tokens = [], [], 0
+
+    def flush():
+        nonlocal names, parts, tokens
+        if parts:
+            chunks.append((names, "".join(parts)))
+        names, parts, tokens = [], [], 0
+
+    for name, text in kept:
+        section_tokens = estimate_tokens(text)
+        if tokens + section_tokens > chunk_tokens and section_tokens <= chunk_tokens:
+            flush()
+        for line in _split_lines(text, chunk_tokens * _CHARS_PER_TOKEN):
+            line_tokens = estimate_tokens(line)
+            if parts and tokens + line_tokens > chunk_tokens:
+                flush()
+            if name not in names:
+                names.append(name)
+            parts.append(line)
+            tokens += line_tokens
+    flush()
+    return chunks
+
+def build_prompt(template, content, token_budget=ANALYSIS_PROMPT_TOKEN_BUDGET):
+    """
+    Fills `template` (with a {content} placeholder) so that the whole prompt fits in
+    `token_budget` estimated tokens. Returns (prompt, stats); stats additionally
+    holds the estimated 'prompt_tokens' of the final prompt.
+    """
+    template_tokens = estimate_tokens(template.format(content=''))
+    fitted, stats = fit_content_to_budget(content, max(token_budget - template_tokens, 0))
+    prompt = template.format(content=fitted)
+    stats['prompt_tokens'] = estimate_tokens(prompt)
+    return prompt, stats
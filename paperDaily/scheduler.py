@@ -0,0 +1,209 @@
+import multiprocessing
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from multiprocessing.connection import wait
+from config import PROFILES, SCHEDULE_CATCHUP_HOURS, SCHEDULER_LOCK_FILE
+from paper_store import get_last_fire_times, record_fire
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+# Upper bound on one wait, so wall-clock jumps (suspend, DST, NTP) are noticed within a minute.
+_MAX_WAIT_SECONDS = 60
+
+# (name, lowest, highest) of the five cron fields
+_CRON_FIELDS = (('minute', 0, 59), ('hour', 0, 23), ('day of month', 1, 31), ('month', 1, 12), ('day of week', 0, 7))
+
+
+def _parse_cron_field(field, name, lowest, highest):
+    """Parses one cron field ('*', '5', '1-5', '*/15', '0-30/10', comma lists) into a set of values."""
+    values = set()
+    for part in field.split(','):
+        spec, _, step = part.partition('/')
+        try:
+            step = int(step) if step else 1
+            if spec == '*':
+                start, end = lowest, highest
+            elif '-' in spec:
+                start, end = (int(value) for value in spec.split('-', 1))
+            else:
+                start = int(spec)
+                end = highest if step > 1 else start
+        except ValueError:
+            raise ValueError(f"Invalid {name} field '{field}' in cron expression") from None
+        if step < 1 or start < lowest or end > highest or start > end:
+            raise ValueError(f"Invalid {name} field '{field}': values must lie in {lowest}-{highest}")
+        values.update(range(start, end + 1, step))
+    return values
+
+class CronTrigger:
+    """
+    A standard five-field cron expression ("minute hour day-of-month month day-of-week",
+    Sunday = 0 or 7) evaluated in local time. As in cron, a day matches if either day field
+    matches when both are restricted.
+    """
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression '{expression}' must have 5 fields")
+        self.expression = expression
+        parsed = [_parse_cron_field(field, *spec) for field, spec in zip(fields, _CRON_FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    def _day_matches(self, moment):
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays # datetime: Monday = 0; cron: Sunday = 0
+        if self.any_day or self.any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, moment):
+        """Returns the first matching minute strictly after `moment` (a naive local datetime)."""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5) # Covers leap days; anything later never matches
+        while candidate < limit:
+            if candidate.month not in self.months:
+                candidate = (candidate.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron expression '{self.expression}' never matches")
+
+@contextmanager
+def job_lock(path=SCHEDULER_LOCK_FILE):
+    """
+    Holds an exclusive lock on `path` for the duration of a job, so runs started by the
+    scheduler, by hand or by a second scheduler never overlap. Waits if another run holds it.
+    """
+    with open(path, 'a+') as lock_file:
+        try:
+            _lock_file(lock_file, blocking=False)
+        except OSError:
+            print(f"Another run holds {path}; waiting for it to finish...")
+            _lock_file(lock_file, blocking=True)
+        try:
+            yield
+        finally:
+            _unlock_file(lock_file)
+
+def _lock_file(lock_file, blocking):
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        return
+    lock_file.seek(0)
+    while True:
+        try:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            return
+        except OSError:
+            if not blocking:
+                raise
+            time.sleep(1)
+
+def _unlock_file(lock_file):
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+    else:
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def run_job_in_worker(profiles):
+    """
+    Worker process entry point: restricts the configuration to the due `profiles` and runs
+    main.job() under the job lock. Everything the job allocates goes away with the process.
+    """
+    import config
+    config.PROFILES[:] = profiles # In place, so modules that imported PROFILES see the subset
+    import main
+    with job_lock():
+        main.job()
+
+def _initial_fire_times(triggers, now):
+    """
+    Returns {profile: next fire time}. A profile whose last run is older than its most recent
+    trigger time missed a run while the scheduler was down: it fires now if that trigger time is
+    within SCHEDULE_CATCHUP_HOURS (several missed runs coalesce into one). Profiles that never ran fire now.
+    """
+    last_fire_times = get_last_fire_times()
+    catchup_start = now - timedelta(hours=SCHEDULE_CATCHUP_HOURS)
+    next_fire = {}
+    for name, trigger in triggers.items():
+        if name not in last_fire_times:
+            next_fire[name] = now
+            continue
+        last_fire = datetime.fromtimestamp(last_fire_times[name])
+        missed_at = trigger.next_after(max(last_fire, catchup_start))
+        if missed_at <= now:
+            print(f"Profile '{name}' missed its run at {missed_at:%Y-%m-%d %H:%M}; catching up now.")
+            next_fire[name] = now
+            continue
+        next_fire[name] = missed_at
+        if trigger.next_after(last_fire) <= now:
+            print(f"Profile '{name}' missed runs more than {SCHEDULE_CATCHUP_HOURS}h ago; "
+                  f"next run at {missed_at:%Y-%m-%d %H:%M}.")
+    return next_fire
+
+def run_scheduler(profiles=PROFILES):
+    """
+    Runs each profile's digest on its cron schedule until interrupted. Profiles due at the
+    same time share one job (one fetch and analysis pass); a trigger that fires while a job
+    is still running waits for it instead of overlapping, and repeated triggers coalesce.
+    Each job runs in a fresh spawned process so the scheduler's own memory stays flat.
+    """
+    profiles_by_name = {profile['name']: profile for profile in profiles}
+    triggers = {name: CronTrigger(profile['schedule']) for name, profile in profiles_by_name.items()}
+    next_fire = _initial_fire_times(triggers, datetime.now())
+    context = multiprocessing.get_context('spawn')
+    worker = None
+    deferred_noted = False
+    print(f"Scheduler started (pid {os.getpid()}) for {len(triggers)} profile(s).")
+    try:
+        while True:
+            now = datetime.now()
+            due = sorted(name for name, fire_at in next_fire.items() if fire_at <= now)
+            if due and worker is None:
+                record_fire(due, now.timestamp())
+                for name in due:
+                    next_fire[name] = triggers[name].next_after(now)
+                print(f"Starting scheduled run for profile(s) {', '.join(due)} at {now:%Y-%m-%d %H:%M}.")
+                worker = context.Process(
+                    target=run_job_in_worker, args=([profiles_by_name[name] for name in due],), name=f"job-{'-'.join(due)}"
+                )
+                worker.start()
+            elif due and not deferred_noted:
+                print(f"Run for profile(s) {', '.join(due)} is due while a job is still running; it starts when that job finishes.")
+                deferred_noted = True
+
+            upcoming = [fire_at for fire_at in next_fire.values() if fire_at > now]
+            timeout = (min(upcoming) - now).total_seconds() if upcoming else _MAX_WAIT_SECONDS
+            timeout = max(0.0, min(timeout, _MAX_WAIT_SECONDS))
+            if worker is None:
+                time.sleep(timeout)
+            elif wait([worker.sentinel], timeout):
+                worker.join()
+                status = "finished" if worker.exitcode == 0 else f"failed with exit code {worker.exitcode}"
+                print(f"Scheduled run {worker.name} {status}. Next runs: " + ", ".join(
+                    f"{name} at {fire_at:%Y-%m-%d %H:%M}" for name, fire_at in sorted(next_fire.items())
+                ))
+                worker.close()
+                worker = None
+                deferred_noted = False
+    except KeyboardInterrupt:
+        print("Scheduler stopped.")
+        if worker is not None:
+            print(f"Waiting for the running job {worker.name} to finish...")
+            worker.join()